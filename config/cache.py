@@ -0,0 +1,302 @@
+import logging
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+from redis.exceptions import RedisError
+
+from config.metrics import InstrumentedCacheMixin
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class CircuitBreaker:
+    """Размыкатель: после threshold ошибок подряд обращения к Redis
+    прекращаются на reset_timeout секунд, затем пропускается одна пробная
+    попытка.
+    """
+
+    def __init__(self, threshold=3, reset_timeout=30):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Пробная попытка; при ошибке размыкатель снова откроется
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+class RemoteState:
+    """Состояние связи с Redis, общее для всех потоков процесса.
+
+    Django создает экземпляр бэкенда кеша на каждый поток, поэтому
+    размыкатель и изменения, не дошедшие до Redis, хранятся в реестре по
+    LOCATION — так же, как LocMemCache делит _caches. Иначе каждый поток
+    заново ждал бы таймаута Redis, а изменения из потоков рассылки
+    терялись бы вместе с потоками.
+    """
+
+    def __init__(self, threshold, reset_timeout, max_pending):
+        self.breaker = CircuitBreaker(threshold, reset_timeout)
+        # Операции с ключами LOCAL_BYPASS, не дошедшие до Redis:
+        # (key, version) -> [(метод, аргументы), ...]
+        self.pending = {}
+        self.max_pending = max_pending
+        self.pending_lock = threading.Lock()
+        self.replay_lock = threading.Lock()
+
+
+_states = {}
+_states_lock = threading.Lock()
+
+
+class TieredCache(BaseCache):
+    """Двухуровневый кеш: LRU в памяти процесса перед Redis.
+
+    Чтения обслуживаются из локального уровня с коротким TTL, промахи идут
+    в Redis, записи — в оба уровня. Redis стоит за размыкателем: пока он
+    недоступен, кеш работает только в памяти процесса и не выбрасывает
+    ошибок. Ключи с префиксами из LOCAL_BYPASS (счетчики версий,
+    прогресс рассылок) при доступном Redis читаются только из него, чтобы
+    процессы не видели устаревших значений. Их изменения, сделанные без
+    Redis, запоминаются и повторяются в Redis перед первым обращением к
+    нему после восстановления: иначе Redis вернул бы поколение данных до
+    сбоя, и закешированные под ним страницы снова считались бы свежими.
+
+    OPTIONS: LOCAL_TIMEOUT, LOCAL_MAX_ENTRIES, LOCAL_BYPASS,
+    BREAKER_THRESHOLD, BREAKER_RESET_TIMEOUT; остальные параметры
+    передаются пулу соединений Redis.
+    """
+
+    def __init__(self, server, params):
+        super().__init__(params)
+        options = dict(params.get("OPTIONS", {}))
+        self.local_timeout = options.pop("LOCAL_TIMEOUT", 5)
+        self.local_bypass = tuple(options.pop("LOCAL_BYPASS", ()))
+        threshold = options.pop("BREAKER_THRESHOLD", 3)
+        reset_timeout = options.pop("BREAKER_RESET_TIMEOUT", 30)
+        local_max_entries = options.pop("LOCAL_MAX_ENTRIES", 1000)
+        options.setdefault("socket_connect_timeout", 0.5)
+        options.setdefault("socket_timeout", 0.5)
+
+        shared = {
+            key: params[key]
+            for key in ("KEY_PREFIX", "VERSION", "KEY_FUNCTION")
+            if key in params
+        }
+        self.local = LocMemCache(
+            f"tiered:{server}",
+            {
+                **shared,
+                "TIMEOUT": self.local_timeout,
+                "OPTIONS": {"MAX_ENTRIES": local_max_entries},
+            },
+        )
+        self.remote = RedisCache(
+            server,
+            {**shared, "TIMEOUT": params.get("TIMEOUT", 300), "OPTIONS": options},
+        )
+        with _states_lock:
+            self.state = _states.setdefault(
+                server, RemoteState(threshold, reset_timeout, local_max_entries)
+            )
+        self.breaker = self.state.breaker
+
+    def _remote(self, method, *args, **kwargs):
+        """Вызов Redis через размыкатель; (успех, результат)"""
+        if not self.breaker.allow():
+            return False, None
+        try:
+            if self.state.pending:
+                self._replay()
+            result = getattr(self.remote, method)(*args, **kwargs)
+        except (RedisError, OSError) as e:
+            self.breaker.failure()
+            logger.warning("Redis недоступен (%s), работаем на локальном кеше", e)
+            return False, None
+        self.breaker.success()
+        return True, result
+
+    def _remember(self, method, key, version, *args):
+        """Запоминает изменение ключа LOCAL_BYPASS, не записанное в Redis"""
+        if not key.startswith(self.local_bypass):
+            return
+        with self.state.pending_lock:
+            ops = self.state.pending.get((key, version))
+            if ops is None:
+                if len(self.state.pending) >= self.state.max_pending:
+                    logger.warning(
+                        "Слишком много изменений без Redis, %s потеряно", key
+                    )
+                    return
+                ops = self.state.pending[(key, version)] = []
+            if method == "incr" and ops and ops[-1][0] == "incr":
+                ops[-1] = ("incr", (ops[-1][1][0] + args[0],))
+            else:
+                ops.append((method, args))
+
+    def _replay(self):
+        """Повторяет в Redis изменения, сделанные во время его недоступности.
+
+        Выполняется до любого другого обращения к Redis; остальные потоки
+        ждут окончания, чтобы не прочитать значения до сбоя.
+        """
+        with self.state.replay_lock:
+            while self.state.pending:
+                with self.state.pending_lock:
+                    (key, version), ops = self.state.pending.popitem()
+                for done, (method, args) in enumerate(ops):
+                    try:
+                        getattr(self.remote, method)(key, *args, version=version)
+                    except ValueError:
+                        # incr ключа, которого в Redis уже нет — читатели
+                        # начнут поколение заново
+                        pass
+                    except (RedisError, OSError):
+                        # Вернуть неповторенные операции перед записанными
+                        # за это время другими потоками
+                        with self.state.pending_lock:
+                            newer = self.state.pending.get((key, version), [])
+                            self.state.pending[(key, version)] = ops[done:] + newer
+                        raise
+
+    def _local_timeout(self, timeout):
+        if timeout is DEFAULT_TIMEOUT or timeout is None:
+            return self.local_timeout
+        return min(timeout, self.local_timeout)
+
+    def _bypass_local(self, key):
+        return key.startswith(self.local_bypass) and not self.breaker.is_open
+
+    def get(self, key, default=None, version=None):
+        if not self._bypass_local(key):
+            value = self.local.get(key, _MISSING, version)
+            if value is not _MISSING:
+                return value
+        ok, value = self._remote("get", key, _MISSING, version)
+        if not ok:
+            return self.local.get(key, default, version)
+        if value is _MISSING:
+            return default
+        self.local.set(key, value, self.local_timeout, version)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.local.set(key, value, self._local_timeout(timeout), version)
+        ok, _ = self._remote("set", key, value, timeout, version)
+        if not ok:
+            self._remember("set", key, version, value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        ok, added = self._remote("add", key, value, timeout, version)
+        if not ok:
+            self._remember("add", key, version, value, timeout)
+            return self.local.add(key, value, self._local_timeout(timeout), version)
+        if added:
+            self.local.set(key, value, self._local_timeout(timeout), version)
+        else:
+            self.local.delete(key, version)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self.local.touch(key, self._local_timeout(timeout), version)
+        ok, touched = self._remote("touch", key, timeout, version)
+        return touched if ok else self.local.has_key(key, version)
+
+    def delete(self, key, version=None):
+        deleted = self.local.delete(key, version)
+        ok, remote_deleted = self._remote("delete", key, version)
+        if not ok:
+            self._remember("delete", key, version)
+        return remote_deleted if ok else deleted
+
+    def incr(self, key, delta=1, version=None):
+        ok, value = self._remote("incr", key, delta, version)
+        if not ok:
+            value = self.local.incr(key, delta, version)
+            self._remember("incr", key, version, delta)
+            return value
+        self.local.set(key, value, self.local_timeout, version)
+        return value
+
+    def has_key(self, key, version=None):
+        if self.local.has_key(key, version) and not self._bypass_local(key):
+            return True
+        ok, found = self._remote("has_key", key, version)
+        return found if ok else self.local.has_key(key, version)
+
+    def get_many(self, keys, version=None):
+        result = {}
+        missing = []
+        for key in keys:
+            value = (
+                _MISSING
+                if self._bypass_local(key)
+                else self.local.get(key, _MISSING, version)
+            )
+            if value is _MISSING:
+                missing.append(key)
+            else:
+                result[key] = value
+        if missing:
+            ok, found = self._remote("get_many", missing, version)
+            if not ok:
+                found = self.local.get_many(missing, version)
+            else:
+                self.local.set_many(found, self.local_timeout, version)
+            result.update(found)
+        return result
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        self.local.set_many(data, self._local_timeout(timeout), version)
+        ok, failed = self._remote("set_many", data, timeout, version)
+        if not ok:
+            for key, value in data.items():
+                self._remember("set", key, version, value, timeout)
+        return failed if ok else []
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        self.local.delete_many(keys, version)
+        ok, _ = self._remote("delete_many", keys, version)
+        if not ok:
+            for key in keys:
+                self._remember("delete", key, version)
+
+    def clear(self):
+        self.local.clear()
+        self._remote("clear")
+
+    def close(self, **kwargs):
+        self.remote.close(**kwargs)
+
+
+class InstrumentedTieredCache(InstrumentedCacheMixin, TieredCache):
+    pass
@@ -0,0 +1,245 @@
+import bisect
+import contextvars
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+from django.db import connections
+from django.http import Http404, HttpResponse
+
+logger = logging.getLogger(__name__)
+
+# Границы гистограммы длительности запросов, секунд
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_current = contextvars.ContextVar("request_metrics", default=None)
+_MISSING = object()
+
+
+class RequestMetrics:
+    """Счетчики одного запроса: SQL, время БД, обращения к кешу"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.duration = 0.0
+        self.queries = 0
+        self.db_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.statements = Counter()
+
+    def top_query(self):
+        """Самый часто повторяющийся SQL запроса и число повторов"""
+        if not self.statements:
+            return None, 0
+        return self.statements.most_common(1)[0]
+
+    def __call__(self, execute, sql, params, many, context):
+        """Обертка connection.execute_wrapper: считает запросы и их время"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+            self.statements[sql] += 1
+
+
+def record_cache(hits=0, misses=0):
+    """Учитывает обращения к кешу в метриках текущего запроса"""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.cache_hits += hits
+        metrics.cache_misses += misses
+
+
+class InstrumentedCacheMixin:
+    """Бэкенд кеша, который считает попадания и промахи для метрик"""
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version)
+        if value is _MISSING:
+            record_cache(misses=1)
+            return default
+        record_cache(hits=1)
+        return value
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        values = super().get_many(keys, version)
+        record_cache(hits=len(values), misses=len(keys) - len(values))
+        return values
+
+
+class InstrumentedRedisCache(InstrumentedCacheMixin, RedisCache):
+    pass
+
+
+class InstrumentedLocMemCache(InstrumentedCacheMixin, LocMemCache):
+    pass
+
+
+class MetricsRegistry:
+    """Накопленные метрики процесса в разрезе view, метода и статуса.
+
+    Каждый процесс веб-сервера считает свои запросы — Prometheus
+    собирает их с каждого процесса отдельно.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = Counter()
+            self.duration = defaultdict(float)
+            self.buckets = defaultdict(lambda: [0] * (len(LATENCY_BUCKETS) + 1))
+            self.queries = Counter()
+            self.db_time = defaultdict(float)
+            self.cache_hits = Counter()
+            self.cache_misses = Counter()
+
+    def observe(self, view, method, status, metrics):
+        labels = (view, method, str(status))
+        with self._lock:
+            self.requests[labels] += 1
+            self.duration[view] += metrics.duration
+            self.buckets[view][
+                bisect.bisect_left(LATENCY_BUCKETS, metrics.duration)
+            ] += 1
+            self.queries[view] += metrics.queries
+            self.db_time[view] += metrics.db_time
+            self.cache_hits[view] += metrics.cache_hits
+            self.cache_misses[view] += metrics.cache_misses
+
+    def render(self):
+        """Метрики в текстовом формате Prometheus"""
+        lines = []
+
+        def header(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        def sample(name, labels, value):
+            rendered = ",".join(f'{label}="{text}"' for label, text in labels)
+            lines.append(f"{name}{{{rendered}}} {value}")
+
+        with self._lock:
+            header("http_requests_total", "counter", "Число обработанных запросов")
+            for (view, method, status), count in sorted(self.requests.items()):
+                sample(
+                    "http_requests_total",
+                    [("view", view), ("method", method), ("status", status)],
+                    count,
+                )
+
+            name = "http_request_duration_seconds"
+            header(name, "histogram", "Длительность обработки запроса, секунд")
+            for view, counts in sorted(self.buckets.items()):
+                total = 0
+                for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), counts):
+                    total += count
+                    sample(f"{name}_bucket", [("view", view), ("le", bound)], total)
+                sample(f"{name}_sum", [("view", view)], self.duration[view])
+                sample(f"{name}_count", [("view", view)], total)
+
+            for name, help_text, values in (
+                ("http_request_db_queries_total", "Число SQL-запросов", self.queries),
+                (
+                    "http_request_db_seconds_total",
+                    "Время выполнения SQL-запросов, секунд",
+                    self.db_time,
+                ),
+                ("http_request_cache_hits_total", "Попадания в кеш", self.cache_hits),
+                ("http_request_cache_misses_total", "Промахи кеша", self.cache_misses),
+            ):
+                header(name, "counter", help_text)
+                for view, value in sorted(values.items()):
+                    sample(name, [("view", view)], value)
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+class MetricsMiddleware:
+    """Считает SQL-запросы, время БД, обращения к кешу и длительность запроса.
+
+    Итоги копятся в registry и отдаются view metrics. Запросы дольше
+    SLOW_REQUEST_THRESHOLD секунд пишутся в лог вместе с самым частым
+    повторяющимся SQL. При METRICS_DEBUG_PANEL счетчики выводятся внизу
+    HTML-страниц.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        metrics.duration = time.perf_counter() - metrics.started
+
+        match = request.resolver_match
+        view = match.view_name if match else "unresolved"
+        registry.observe(view, request.method, response.status_code, metrics)
+        if metrics.duration >= settings.SLOW_REQUEST_THRESHOLD:
+            sql, repeats = metrics.top_query()
+            logger.warning(
+                "Медленный запрос %s %s: %.3f с, SQL-запросов %s (%.3f с), "
+                "кеш %s/%s, чаще всего (%s раз): %s",
+                request.method,
+                request.path,
+                metrics.duration,
+                metrics.queries,
+                metrics.db_time,
+                metrics.cache_hits,
+                metrics.cache_misses,
+                repeats,
+                sql,
+            )
+        if settings.METRICS_DEBUG_PANEL:
+            self.add_debug_panel(response, metrics)
+        return response
+
+    def add_debug_panel(self, response, metrics):
+        response["Server-Timing"] = (
+            f"db;dur={metrics.db_time * 1000:.1f}, "
+            f"total;dur={metrics.duration * 1000:.1f}"
+        )
+        if response.streaming or "text/html" not in response.get("Content-Type", ""):
+            return
+        content = response.content.decode(response.charset)
+        if "</body>" not in content:
+            return
+        panel = (
+            '<div style="position:fixed;bottom:0;right:0;z-index:9999;'
+            'padding:4px 8px;background:#222;color:#eee;font:12px monospace">'
+            f"{metrics.duration * 1000:.0f} мс · SQL {metrics.queries} "
+            f"({metrics.db_time * 1000:.0f} мс) · кеш "
+            f"{metrics.cache_hits}/{metrics.cache_misses}</div>"
+        )
+        response.content = content.replace("</body>", panel + "</body>", 1)
+        if response.has_header("Content-Length"):
+            response["Content-Length"] = len(response.content)
+
+
+def metrics_view(request):
+    """Метрики в формате Prometheus, доступны только с адресов из настроек"""
+    if request.META.get("REMOTE_ADDR") not in settings.METRICS_ALLOWED_IPS:
+        raise Http404
+    return HttpResponse(
+        registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
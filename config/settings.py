@@ -49,6 +49,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "config.metrics.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -147,18 +148,81 @@ EMAIL_HOST_USER = os.getenv
 EMAIL_HOST_PASSWORD = os.getenv
 DEFAULT_FROM_EMAIL = os.getenv
 
+# Размер пачки писем, отправляемых через одно SMTP-соединение
+MAILING_BATCH_SIZE = int(os.getenv("MAILING_BATCH_SIZE", 500))
+# Число потоков, каждый со своим SMTP-соединением
+MAILING_WORKERS = int(os.getenv("MAILING_WORKERS", 4))
+# Ограничение скорости, писем в секунду на все воркеры (0 — без ограничения)
+MAILING_HOST_RATE = float(os.getenv("MAILING_HOST_RATE", 0))
+MAILING_DOMAIN_RATE = float(os.getenv("MAILING_DOMAIN_RATE", 0))
+# Число получателей в одной задаче Celery
+MAILING_CHUNK_SIZE = int(os.getenv("MAILING_CHUNK_SIZE", 1000))
+# Сколько получателей читать из БД за один проход серверного курсора
+MAILING_ITERATOR_CHUNK_SIZE = int(os.getenv("MAILING_ITERATOR_CHUNK_SIZE", 2000))
+# Сколько результатов доставки копить перед bulk_create
+MAILING_LEDGER_BUFFER = int(os.getenv("MAILING_LEDGER_BUFFER", 1000))
+
+# Сколько строк файла импорта клиентов проверять и вставлять за раз
+CLIENT_IMPORT_BATCH_SIZE = int(os.getenv("CLIENT_IMPORT_BATCH_SIZE", 1000))
+
+# Сколько строк читать из БД за раз при выгрузке в CSV
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", 2000))
+
+# Демон run_scheduler: период опроса журнала изменений в кеше и полной
+# сверки расписания с БД, секунд
+SCHEDULER_POLL_INTERVAL = float(os.getenv("SCHEDULER_POLL_INTERVAL", 0.5))
+SCHEDULER_RESYNC_INTERVAL = float(os.getenv("SCHEDULER_RESYNC_INTERVAL", 600))
+# Сколько наступивших рассылок забирать за одну транзакцию
+SCHEDULER_CLAIM_BATCH_SIZE = int(os.getenv("SCHEDULER_CLAIM_BATCH_SIZE", 100))
+# Через сколько секунд повторить постановку рассылки в очередь, если брокер
+# был недоступен
+SCHEDULER_RETRY_DELAY = int(os.getenv("SCHEDULER_RETRY_DELAY", 60))
+
+CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://127.0.0.1:6379/0")
+CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", "redis://127.0.0.1:6379/0")
+CELERY_TASK_SERIALIZER = "json"
+CELERY_TIMEZONE = TIME_ZONE
+
 
 AUTH_USER_MODEL = "users.User"
 
+# Метрики запросов (config/metrics.py): адреса, с которых доступен
+# /metrics, порог медленного запроса в секундах и панель счетчиков внизу
+# страниц
+METRICS_ALLOWED_IPS = os.getenv("METRICS_ALLOWED_IPS", "127.0.0.1,::1").split(",")
+SLOW_REQUEST_THRESHOLD = float(os.getenv("SLOW_REQUEST_THRESHOLD", 1.0))
+METRICS_DEBUG_PANEL = os.getenv("METRICS_DEBUG_PANEL", str(DEBUG)) == "True"
+
+# Сколько хранить закешированные страницы списков и рассылок, секунд;
+# устаревшие страницы отсекаются раньше по поколению данных владельца
+RESPONSE_CACHE_TIMEOUT = int(os.getenv("RESPONSE_CACHE_TIMEOUT", 60 * 10))
+
+# Права пользователей кешируются между запросами, см. users/permissions.py
+AUTHENTICATION_BACKENDS = ["users.permissions.CachedPermissionBackend"]
+PERMISSIONS_CACHE_TIMEOUT = int(os.getenv("PERMISSIONS_CACHE_TIMEOUT", 60 * 60))
+
 LOGIN_REDIRECT_URL = "messaging:mailing_list"
 LOGOUT_REDIRECT_URL = "messaging:mailing_list"
 LOGIN_URL = "users:login"
 
 CACHE_ENABLED = True
 if CACHE_ENABLED:
+    # Локальный LRU-кеш процесса перед Redis (config/cache.py): при
+    # недоступном Redis запросы обслуживаются из памяти процесса
     CACHES = {
         "default": {
-            "BACKEND": "django.core.cache.backends.redis.RedisCache",
-            "LOCATION": "redis://127.0.0.1:6379/1",
+            "BACKEND": "config.cache.InstrumentedTieredCache",
+            "LOCATION": os.getenv("CACHE_LOCATION", "redis://127.0.0.1:6379/1"),
+            "OPTIONS": {
+                "LOCAL_TIMEOUT": float(os.getenv("CACHE_LOCAL_TIMEOUT", 5)),
+                "LOCAL_MAX_ENTRIES": int(os.getenv("CACHE_LOCAL_MAX_ENTRIES", 1000)),
+                # Счетчики, которые меняют другие процессы, читаются из Redis
+                "LOCAL_BYPASS": [
+                    "generation:",
+                    "permissions:version",
+                    "scheduler:changes",
+                    "mailing:",
+                ],
+            },
         }
-    }
\ No newline at end of file
+    }
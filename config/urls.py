@@ -2,8 +2,11 @@ from django.urls import path, include
 from django.views.generic.base import RedirectView
 from django.contrib import admin
 
+from config.metrics import metrics_view
+
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("metrics", metrics_view, name="metrics"),
     path("", include("messaging.urls", namespace="messaging")),
     path("users/", include("users.urls", namespace="users")),
 ]
\ No newline at end of file
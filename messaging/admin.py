@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import Client, Message, Mailing, Attempt
+from django.db.models import Count
+
+from .models import Client, Message, Mailing, Attempt, DailyStats, Delivery
 
 
 @admin.register(Client)
@@ -26,6 +28,13 @@ class MailingAdmin(admin.ModelAdmin):
     search_fields = ("status", "message__subject")
     list_filter = ("status", "start_time")
     filter_horizontal = ("clients",)
+    list_select_related = ("message",)
+
+    def get_queryset(self, request):
+        # Число получателей считается в том же запросе, что и список
+        return (
+            super().get_queryset(request).annotate(clients_total=Count("clients"))
+        )
 
     def message_subject(self, obj):
         return obj.message.subject
@@ -33,9 +42,10 @@ class MailingAdmin(admin.ModelAdmin):
     message_subject.short_description = "Тема письма"
 
     def clients_count(self, obj):
-        return obj.clients.count()
+        return obj.clients_total
 
     clients_count.short_description = "Кол-во получателей"
+    clients_count.admin_order_field = "clients_total"
 
 
 @admin.register(Attempt)
@@ -49,13 +59,36 @@ class MailingAttemptAdmin(admin.ModelAdmin):
     )
     search_fields = ("status", "server_response", "mailing__message__subject")
     list_filter = ("status", "attempt_time")
+    list_select_related = ("mailing__message",)
 
     def mailing_info(self, obj):
-        return f"Рассылка #{obj.mailing.id} ({obj.mailing.message.subject})"
+        return f"Рассылка #{obj.mailing_id} ({obj.mailing.message.subject})"
 
     mailing_info.short_description = "Рассылка"
 
     def server_response_preview(self, obj):
         return f"{obj.server_response[:50]}..." if obj.server_response else ""
 
-    server_response_preview.short_description = "Ответ сервера"
\ No newline at end of file
+    server_response_preview.short_description = "Ответ сервера"
+
+
+@admin.register(Delivery)
+class DeliveryAdmin(admin.ModelAdmin):
+    list_display = ("id", "email", "status", "smtp_code", "sent_at")
+    search_fields = ("email", "server_response")
+    list_filter = ("status", "sent_at")
+    raw_id_fields = ("attempt", "mailing", "client")
+
+
+@admin.register(DailyStats)
+class DailyStatsAdmin(admin.ModelAdmin):
+    list_display = (
+        "owner",
+        "date",
+        "successful_attempts",
+        "failed_attempts",
+        "messages_sent",
+        "messages_failed",
+    )
+    list_filter = ("date",)
+    list_select_related = ("owner",)
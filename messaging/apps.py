@@ -3,4 +3,7 @@ from django.apps import AppConfig
 
 class MessagingConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
-    name = "messaging"
\ No newline at end of file
+    name = "messaging"
+
+    def ready(self):
+        from messaging import signals  # noqa: F401
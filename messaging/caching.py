@@ -0,0 +1,98 @@
+import hashlib
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from users.permissions import permissions_version
+
+
+def generation_key(owner_id=None):
+    return f"generation:{owner_id or 'all'}"
+
+
+def get_generation(owner_id=None):
+    """Поколение данных владельца (без owner_id — всех владельцев).
+
+    Номер входит в ключи закешированных страниц и фрагментов, поэтому
+    после изменения данных старые записи просто перестают читаться.
+    """
+    key = generation_key(owner_id)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, 1, None)
+        generation = cache.get(key, 1)
+    return generation
+
+
+def bump_generation(*owner_ids):
+    """Сбрасывает кеш владельцев и общий кеш пользователей с can_view_all"""
+    for key in {generation_key()} | {generation_key(pk) for pk in owner_ids if pk}:
+        cache.add(key, 1, None)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Ключ вытеснен между add и incr — при чтении начнется заново,
+            # а старые записи устареют по таймауту
+            cache.delete(key)
+
+
+class CachedResponseMixin:
+    """Кеширует GET-ответ view по пользователю и поколению его данных.
+
+    Пользователь с can_view_all видит объекты всех владельцев, поэтому для
+    него берется общее поколение. В ключ входят также версия прав и
+    CSRF-cookie: в странице есть формы с CSRF-токеном, который годится
+    только для своей сессии. Страницы с непоказанными flash-сообщениями
+    не кешируются и не берутся из кеша.
+    """
+
+    response_cache_timeout = None
+
+    def get_cache_generation(self):
+        user = self.request.user
+        if user.has_perm("users.can_view_all"):
+            return get_generation()
+        return get_generation(user.pk)
+
+    def get_response_cache_key(self):
+        request = self.request
+        csrf = request.COOKIES.get(settings.CSRF_COOKIE_NAME)
+        # Без CSRF-cookie ответ должен ее выставить — такой не кешируем
+        if not request.user.is_authenticated or not csrf:
+            return None
+        if len(messages.get_messages(request)):
+            return None
+        digest = hashlib.md5(
+            f"{request.get_full_path()}:{csrf}".encode(), usedforsecurity=False
+        ).hexdigest()
+        return "view:{}:{}:{}:{}:{}".format(
+            type(self).__name__,
+            request.user.pk,
+            permissions_version(),
+            self.get_cache_generation(),
+            digest,
+        )
+
+    def get(self, request, *args, **kwargs):
+        key = self.get_response_cache_key()
+        cached = cache.get(key) if key else None
+        if cached is not None:
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+
+        response = super().get(request, *args, **kwargs)
+        if key and response.status_code == 200:
+            timeout = self.response_cache_timeout or settings.RESPONSE_CACHE_TIMEOUT
+
+            def store(response):
+                cache.set(key, (response.content, response["Content-Type"]), timeout)
+
+            response.add_post_render_callback(store)
+        return response
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["cache_generation"] = self.get_cache_generation()
+        return context
@@ -0,0 +1,70 @@
+from django.apps import apps as global_apps
+from django.db import transaction
+from django.db.models import Case, F, Min, Value, When, Window
+from django.db.models.functions import Lower, Trim
+
+from messaging.services import chunked
+
+# Сколько дубликатов переносить за один проход
+MERGE_BATCH_SIZE = 1000
+
+
+def normalize_email(email):
+    """Email в том виде, в котором он хранится и сравнивается"""
+    return (email or "").strip().lower()
+
+
+def merge_duplicate_clients(apps=global_apps, batch_size=MERGE_BATCH_SIZE):
+    """Сливает клиентов одного владельца с одинаковым email.
+
+    Из каждой группы остается клиент с наименьшим id, связи рассылок и
+    доставки дубликатов переносятся на него пачками, после чего email всех
+    клиентов приводится к нормализованному виду. Принимает apps, чтобы
+    работать и из миграции с историческими моделями. Возвращает число
+    удаленных дубликатов.
+    """
+    Client = apps.get_model("messaging", "Client")
+    Mailing = apps.get_model("messaging", "Mailing")
+    Delivery = apps.get_model("messaging", "Delivery")
+    Through = Mailing.clients.through
+
+    # Для каждого клиента — наименьший id в его группе (владелец, email)
+    group = [F("owner_id"), Lower(Trim("email"))]
+    duplicates = list(
+        Client.objects.annotate(keeper=Window(Min("id"), partition_by=group))
+        .exclude(id=F("keeper"))
+        .order_by("id")
+        .values_list("id", "keeper")
+    )
+    for batch in chunked(duplicates, batch_size):
+        _merge(dict(batch), Client, Through, Delivery)
+
+    Client.objects.exclude(email=Lower(Trim("email"))).update(
+        email=Lower(Trim("email"))
+    )
+    return len(duplicates)
+
+
+def _merge(duplicates, Client, Through, Delivery):
+    """Переносит связи дубликатов на оставляемых клиентов, удаляет дубликаты"""
+    with transaction.atomic():
+        links = Through.objects.filter(client_id__in=duplicates)
+        Through.objects.bulk_create(
+            [
+                Through(mailing_id=mailing_id, client_id=duplicates[client_id])
+                for mailing_id, client_id in links.values_list(
+                    "mailing_id", "client_id"
+                )
+            ],
+            ignore_conflicts=True,
+        )
+        links.delete()
+        Delivery.objects.filter(client_id__in=duplicates).update(
+            client_id=Case(
+                *[
+                    When(client_id=pk, then=Value(keeper))
+                    for pk, keeper in duplicates.items()
+                ]
+            )
+        )
+        Client.objects.filter(id__in=duplicates).delete()
@@ -0,0 +1,74 @@
+import csv
+
+from django.conf import settings
+
+from messaging.models import Attempt, Client, Mailing
+
+# Набор выгрузки: модель, поле владельца, колонки (заголовок, поле values_list)
+EXPORTS = {
+    "clients": (
+        Client,
+        "owner",
+        [
+            ("ID", "id"),
+            ("Email", "email"),
+            ("ФИО", "full_name"),
+            ("Комментарий", "comment"),
+        ],
+    ),
+    "mailings": (
+        Mailing,
+        "owner",
+        [
+            ("ID", "id"),
+            ("Тема", "message__subject"),
+            ("Статус", "status"),
+            ("Периодичность", "frequency"),
+            ("Начало", "start_time"),
+            ("Окончание", "end_time"),
+            ("Следующий запуск", "next_run"),
+            ("Активна", "is_active"),
+        ],
+    ),
+    "attempts": (
+        Attempt,
+        "mailing__owner",
+        [
+            ("ID", "id"),
+            ("Время попытки", "attempt_time"),
+            ("Рассылка", "mailing_id"),
+            ("Тема", "mailing__message__subject"),
+            ("Статус", "status"),
+            ("Ответ сервера", "server_response"),
+        ],
+    ),
+}
+
+
+class Echo:
+    """Псевдофайл для csv.writer: возвращает строку вместо записи"""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(kind, user):
+    """Строки выгрузки kind, доступные пользователю, читаются курсором"""
+    model, owner_field, columns = EXPORTS[kind]
+    queryset = model.objects.all()
+    if not user.has_perm("users.can_view_all"):
+        queryset = queryset.filter(**{owner_field: user})
+    return (
+        queryset.order_by("id")
+        .values_list(*[field for _, field in columns])
+        .iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+    )
+
+
+def stream_csv(kind, user):
+    """Генератор CSV: заголовок отдается сразу, строки — по мере чтения из БД"""
+    writer = csv.writer(Echo())
+    # BOM, чтобы Excel распознал UTF-8
+    yield "﻿" + writer.writerow([title for title, _ in EXPORTS[kind][2]])
+    for row in export_rows(kind, user):
+        yield writer.writerow(row)
@@ -1,5 +1,12 @@
+from messaging.dedup import normalize_email
 from messaging.models import Message, Client, Mailing
+from messaging.personalization import (
+    PersonalizedMessage,
+    engine,
+    has_placeholders,
+)
 from django import forms
+from django.template import TemplateSyntaxError
 
 
 class MessageForm(forms.ModelForm):
@@ -9,6 +16,25 @@ class MessageForm(forms.ModelForm):
         widgets = {
             "body": forms.Textarea(attrs={"rows": 5}),
         }
+        help_texts = {
+            "body": "Можно подставить поля клиента: {{ full_name }}, {{ email }}",
+        }
+
+    def clean_subject(self):
+        return self._clean_template("subject")
+
+    def clean_body(self):
+        return self._clean_template("body")
+
+    def _clean_template(self, field):
+        # Ошибка в шаблоне всплыла бы только при отправке рассылки
+        text = self.cleaned_data[field]
+        if has_placeholders(text):
+            try:
+                engine.from_string(text)
+            except TemplateSyntaxError as e:
+                raise forms.ValidationError(f"Ошибка в шаблоне: {e}")
+        return text
 
 
 class ClientForm(forms.ModelForm):
@@ -19,6 +45,33 @@ class ClientForm(forms.ModelForm):
             "comment": forms.Textarea(attrs={"rows": 3}),
         }
 
+    def __init__(self, *args, **kwargs):
+        self.owner = kwargs.pop("owner", None)
+        super().__init__(*args, **kwargs)
+
+    def clean_email(self):
+        email = normalize_email(self.cleaned_data["email"])
+        owner = self.owner or self.instance.owner
+        duplicates = Client.objects.filter(owner=owner, email=email).exclude(
+            pk=self.instance.pk
+        )
+        if owner and duplicates.exists():
+            raise forms.ValidationError("Клиент с таким email уже есть")
+        return email
+
+
+class ClientImportForm(forms.Form):
+    file = forms.FileField(
+        label="Файл CSV или XLSX",
+        help_text="Колонки: email, full_name, comment",
+    )
+
+    def clean_file(self):
+        file = self.cleaned_data["file"]
+        if not file.name.lower().endswith((".csv", ".xlsx")):
+            raise forms.ValidationError("Поддерживаются только файлы CSV и XLSX")
+        return file
+
 
 class MailingForm(forms.ModelForm):
     class Meta:
@@ -31,6 +84,7 @@ class MailingForm(forms.ModelForm):
             "message",
             "status",
             "is_active",
+            "envelope_size",
         ]
         widgets = {
             "start_time": forms.DateTimeInput(attrs={"type": "datetime-local"}),
@@ -43,4 +97,27 @@ class MailingForm(forms.ModelForm):
 
         if user:
             self.fields["clients"].queryset = Client.objects.filter(owner=user)
-            self.fields["message"].queryset = Message.objects.filter(owner=user)
\ No newline at end of file
+            self.fields["message"].queryset = Message.objects.filter(owner=user)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        message = cleaned_data.get("message")
+        envelope_size = cleaned_data.get("envelope_size") or 1
+        # Одно письмо на несколько адресов не может содержать их поля
+        if envelope_size > 1 and message:
+            if PersonalizedMessage(message.subject, message.body).is_personalized:
+                self.add_error(
+                    "envelope_size",
+                    "Сообщение с полями клиента отправляется каждому отдельно",
+                )
+        return cleaned_data
+
+    def save(self, commit=True):
+        # Изменение времени начала или статуса перепланирует рассылку
+        if {"start_time", "status"} & set(self.changed_data):
+            self.instance.next_run = (
+                self.instance.start_time
+                if self.instance.status == Mailing.CREATED
+                else None
+            )
+        return super().save(commit)
@@ -0,0 +1,197 @@
+import csv
+import io
+import logging
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import connection, transaction
+from django.db.models.constants import OnConflict
+
+from messaging.caching import bump_generation
+from messaging.dedup import normalize_email
+from messaging.models import Client
+from messaging.services import chunked
+
+logger = logging.getLogger(__name__)
+
+# Сколько ошибочных строк сохранять в отчете — остальные только считаются
+MAX_REPORTED_ERRORS = 100
+
+COLUMNS = ("email", "full_name", "comment")
+
+
+class ImportFileError(Exception):
+    """Файл импорта не удалось прочитать"""
+
+
+class ImportReport:
+    """Итог импорта клиентов"""
+
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.errors = []
+
+    def add_error(self, line, error):
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, error))
+
+    def __str__(self):
+        return (
+            f"Обработано строк: {self.rows}, добавлено: {self.created}, "
+            f"дубликатов: {self.duplicates}, ошибок: {self.invalid}"
+        )
+
+
+def insert_clients(clients, batch_size):
+    """Добавляет клиентов, пропуская занятые адреса; возвращает число добавленных.
+
+    Параллельный импорт мог успеть добавить тот же адрес — такие строки
+    молча пропускает уникальный индекс (owner, email). bulk_create с
+    ignore_conflicts не сообщает, какие строки вставлены, поэтому запрос
+    INSERT ... ON CONFLICT DO NOTHING собирается с RETURNING id: база
+    возвращает только действительно добавленные строки.
+    """
+    if not connection.features.can_return_rows_from_bulk_insert:
+        # Без RETURNING считаем по числу строк до и после вставки: строки,
+        # добавленные параллельно в этот момент, попадут в добавленные
+        imported = Client.objects.filter(
+            owner=clients[0].owner, email__in=[client.email for client in clients]
+        )
+        with transaction.atomic():
+            before = imported.count()
+            Client.objects.bulk_create(
+                clients, batch_size=batch_size, ignore_conflicts=True
+            )
+            return imported.count() - before
+
+    meta = Client._meta
+    fields = [field for field in meta.concrete_fields if field is not meta.pk]
+    created = 0
+    for batch in chunked(clients, batch_size):
+        created += len(
+            Client.objects._insert(
+                batch,
+                fields,
+                returning_fields=[meta.pk],
+                on_conflict=OnConflict.IGNORE,
+            )
+        )
+    return created
+
+
+def read_csv(fileobj):
+    """Построчно читает CSV с заголовком email, full_name, comment"""
+    if isinstance(fileobj.read(0), bytes):
+        fileobj = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    reader = csv.DictReader(fileobj)
+    if not reader.fieldnames or "email" not in reader.fieldnames:
+        raise ImportFileError("В файле нет колонки email")
+    for row in reader:
+        yield {column: row.get(column) for column in COLUMNS}
+
+
+def read_xlsx(fileobj):
+    """Построчно читает первый лист XLSX в режиме read_only"""
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ImportFileError("Для импорта XLSX установите пакет openpyxl")
+
+    workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = [str(cell or "").strip().lower() for cell in next(rows, ())]
+        if "email" not in header:
+            raise ImportFileError("В файле нет колонки email")
+        for values in rows:
+            row = dict(zip(header, values))
+            yield {
+                column: None if row.get(column) is None else str(row[column])
+                for column in COLUMNS
+            }
+    finally:
+        workbook.close()
+
+
+def read_rows(fileobj, filename):
+    """Выбирает формат по расширению файла"""
+    if filename.lower().endswith(".xlsx"):
+        return read_xlsx(fileobj)
+    return read_csv(fileobj)
+
+
+class ClientImporter:
+    """Импорт клиентов пачками.
+
+    Файл читается построчно, каждая пачка проверяется, email
+    нормализуется и сверяется с уже существующими клиентами владельца
+    одним запросом email__in, поэтому
+    память зависит от размера пачки, а не файла.
+    """
+
+    def __init__(self, owner, batch_size=None):
+        self.owner = owner
+        self.batch_size = batch_size or settings.CLIENT_IMPORT_BATCH_SIZE
+
+    def progress(self, rows):
+        """Импортирует rows, отдавая ImportReport после каждой пачки"""
+        report = ImportReport()
+        # Первая строка файла — заголовок
+        numbered = enumerate(rows, start=2)
+        for batch in chunked(numbered, self.batch_size):
+            self.import_batch(batch, report)
+            logger.info("Импорт клиентов для %s: %s", self.owner, report)
+            yield report
+
+    def run(self, rows):
+        """Импортирует rows целиком, возвращает ImportReport"""
+        report = ImportReport()
+        for report in self.progress(rows):
+            pass
+        return report
+
+    def import_batch(self, batch, report):
+        candidates = {}
+        for line, row in batch:
+            report.rows += 1
+            email = normalize_email(row.get("email"))
+            full_name = (row.get("full_name") or "").strip()
+            try:
+                validate_email(email)
+            except ValidationError:
+                report.add_error(line, f"Некорректный email: {email!r}")
+                continue
+            if not full_name:
+                report.add_error(line, "Не указано ФИО")
+                continue
+            if email in candidates:
+                report.duplicates += 1
+                continue
+            candidates[email] = Client(
+                email=email,
+                full_name=full_name[:255],
+                comment=(row.get("comment") or "").strip() or None,
+                owner=self.owner,
+            )
+
+        existing = set(
+            Client.objects.filter(
+                owner=self.owner, email__in=list(candidates)
+            ).values_list("email", flat=True)
+        )
+        report.duplicates += len(existing)
+        clients = [
+            client for email, client in candidates.items() if email not in existing
+        ]
+        if not clients:
+            return
+        created = insert_clients(clients, self.batch_size)
+        report.created += created
+        report.duplicates += len(clients) - created
+        # bulk_create не отправляет post_save — сбрасываем кеш страниц сами
+        bump_generation(self.owner.pk)
@@ -0,0 +1,54 @@
+import threading
+
+from django.conf import settings
+from django.utils import timezone
+
+from messaging.models import Delivery
+
+
+class DeliveryLedger:
+    """Буфер результатов отправки, записываемый в БД через bulk_create.
+
+    Вместо INSERT на каждого получателя записи копятся в памяти и
+    сбрасываются пачками по MAILING_LEDGER_BUFFER строк.
+    """
+
+    def __init__(self, attempt, buffer_size=None):
+        self.attempt = attempt
+        self.buffer_size = buffer_size or settings.MAILING_LEDGER_BUFFER
+        self._buffer = []
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
+
+    def record(self, recipient, success, smtp_code, response):
+        """Колбэк on_result для BatchSender и ConcurrentDispatcher"""
+        delivery = Delivery(
+            attempt_id=self.attempt.pk,
+            mailing_id=self.attempt.mailing_id,
+            client_id=recipient.get("id"),
+            email=recipient["email"],
+            status=Delivery.SUCCESS if success else Delivery.FAILURE,
+            smtp_code=smtp_code,
+            server_response=response or "",
+            sent_at=timezone.now(),
+        )
+        with self._lock:
+            self._buffer.append(delivery)
+            if len(self._buffer) < self.buffer_size:
+                return
+            buffer, self._buffer = self._buffer, []
+        self._write(buffer)
+
+    def flush(self):
+        with self._lock:
+            buffer, self._buffer = self._buffer, []
+        self._write(buffer)
+
+    def _write(self, buffer):
+        if buffer:
+            Delivery.objects.bulk_create(buffer, batch_size=self.buffer_size)
@@ -0,0 +1,341 @@
+import time
+import tracemalloc
+from datetime import timedelta
+
+from django.core.mail import EmailMessage, get_connection
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.core.paginator import Paginator
+from django.utils import timezone
+
+from messaging.mime import PrebuiltPayload
+from messaging.mixins import encode_cursor, paginate_keyset
+from messaging.models import Attempt, Client, Mailing, Message
+from messaging.personalization import PersonalizedMessage
+from messaging.scheduler import due_mailings
+from messaging.services import BatchSender
+from users.models import User
+
+BENCHMARK_EMAIL = "benchmark@example.com"
+# Владельцы для замеров планов запросов: benchmark-1@example.com и т.д.
+EXTRA_OWNER_EMAIL = "benchmark-{}@example.com"
+SEED_BATCH_SIZE = 10000
+
+
+class Command(BaseCommand):
+    help = "Нагрузочные замеры сервиса рассылок на синтетических данных"
+
+    suites = ("recipients", "pagination", "explain", "render", "mime")
+
+    def add_arguments(self, parser):
+        parser.add_argument("suite", choices=self.suites)
+        parser.add_argument(
+            "--clients", type=int, default=1_000_000, help="Число клиентов"
+        )
+        parser.add_argument(
+            "--attempts", type=int, default=1_000_000, help="Число попыток"
+        )
+        parser.add_argument(
+            "--mailings", type=int, default=100_000, help="Число рассылок"
+        )
+        parser.add_argument(
+            "--owners", type=int, default=100, help="Число владельцев рассылок"
+        )
+        parser.add_argument(
+            "--keep", action="store_true", help="Не удалять данные после замера"
+        )
+
+    def handle(self, *args, **options):
+        owner, _ = User.objects.get_or_create(email=BENCHMARK_EMAIL)
+        try:
+            getattr(self, f"bench_{options['suite']}")(owner, options)
+        finally:
+            if not options["keep"]:
+                self.stdout.write("Удаление тестовых данных...")
+                owner.delete()
+
+    def seed_mailing(self, owner, count):
+        """Создает рассылку на count клиентов, повторно использует готовую"""
+        mailing = Mailing.objects.filter(owner=owner).first()
+        if mailing and mailing.clients.count() == count:
+            return mailing
+
+        Mailing.objects.filter(owner=owner).delete()
+        Client.objects.filter(owner=owner).delete()
+        message = Message.objects.create(
+            subject="Тестовая рассылка", body="Текст письма " * 20, owner=owner
+        )
+        mailing = Mailing.objects.create(
+            start_time=timezone.now(), message=message, owner=owner
+        )
+        through = Mailing.clients.through
+        started = time.perf_counter()
+        for offset in range(0, count, SEED_BATCH_SIZE):
+            clients = Client.objects.bulk_create(
+                Client(
+                    email=f"client{i}@example{i % 100}.com",
+                    full_name=f"Клиент {i}",
+                    owner=owner,
+                )
+                for i in range(offset, min(offset + SEED_BATCH_SIZE, count))
+            )
+            through.objects.bulk_create(
+                through(mailing_id=mailing.id, client_id=client.id)
+                for client in clients
+            )
+        self.stdout.write(
+            f"Создано {count} клиентов за {time.perf_counter() - started:.1f} с"
+        )
+        return mailing
+
+    def measure(self, label, func):
+        """Печатает время и пиковый объем памяти Python при вызове func"""
+        tracemalloc.start()
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.stdout.write(
+            f"{label:<30} {elapsed:8.2f} с   пик памяти {peak / 2**20:8.1f} МБ"
+        )
+        return result
+
+    def bench_recipients(self, owner, options):
+        """Список клиентов целиком против потокового чтения iterator()"""
+        mailing = self.seed_mailing(owner, options["clients"])
+
+        def send(recipients):
+            sender = BatchSender(
+                connection=get_connection(
+                    "django.core.mail.backends.dummy.EmailBackend"
+                ),
+                from_email="noreply@example.com",
+            )
+            return sender.send(
+                mailing.message.subject, mailing.message.body, recipients
+            ).sent
+
+        self.measure(
+            "list(clients.all())",
+            lambda: send({"email": c.email} for c in list(mailing.clients.all())),
+        )
+        self.measure("iter_recipients()", lambda: send(mailing.iter_recipients()))
+
+    def seed_attempts(self, owner, count):
+        """Создает count попыток одной рассылки, повторно использует готовые"""
+        mailing = self.seed_mailing(owner, 0)
+        attempts = Attempt.objects.filter(mailing=mailing)
+        if attempts.count() == count:
+            return attempts
+
+        attempts.delete()
+        started = time.perf_counter()
+        base = timezone.now()
+        for offset in range(0, count, SEED_BATCH_SIZE):
+            created = Attempt.objects.bulk_create(
+                Attempt(mailing=mailing, status=Attempt.SUCCESS)
+                for _ in range(offset, min(offset + SEED_BATCH_SIZE, count))
+            )
+            # auto_now_add не дает задать время при создании
+            Attempt.objects.filter(pk__in=[a.pk for a in created]).update(
+                attempt_time=base - timedelta(seconds=offset)
+            )
+        self.stdout.write(
+            f"Создано {count} попыток за {time.perf_counter() - started:.1f} с"
+        )
+        return attempts
+
+    def bench_pagination(self, owner, options):
+        """Первая и последняя страница истории: OFFSET против keyset"""
+        attempts = self.seed_attempts(owner, options["attempts"])
+        page_size = 50
+        last_page = max(1, options["attempts"] // page_size)
+        paginator = Paginator(attempts.order_by("-attempt_time", "-id"), page_size)
+
+        # Курсор на последнюю строку предпоследней страницы — как если бы
+        # пользователь дошел до конца по ссылкам "Вперед"
+        cursor = None
+        if last_page > 1:
+            boundary = attempts.order_by("-attempt_time", "-id")[
+                (last_page - 1) * page_size - 1
+            ]
+            cursor = encode_cursor("next", boundary, "attempt_time")
+
+        self.measure("OFFSET, страница 1", lambda: list(paginator.page(1)))
+        self.measure(
+            f"OFFSET, страница {last_page}", lambda: list(paginator.page(last_page))
+        )
+        self.measure(
+            "keyset, страница 1",
+            lambda: list(paginate_keyset(attempts, None, page_size, "-attempt_time")),
+        )
+        self.measure(
+            f"keyset, страница {last_page}",
+            lambda: list(paginate_keyset(attempts, cursor, page_size, "-attempt_time")),
+        )
+
+    def seed_owners(self, owner, options):
+        """Рассылки и попытки нескольких владельцев для замеров планов.
+
+        Лишь малая часть рассылок ждет отправки, как в рабочей базе.
+        """
+        owners = [owner] + [
+            User.objects.get_or_create(email=EXTRA_OWNER_EMAIL.format(i))[0]
+            for i in range(1, options["owners"])
+        ]
+        total = options["mailings"]
+        if Mailing.objects.filter(owner__in=owners).count() == total:
+            return owners
+
+        Mailing.objects.filter(owner__in=owners).delete()
+        started = time.perf_counter()
+        messages = Message.objects.bulk_create(
+            Message(subject="Тестовая рассылка", body="Текст", owner=o) for o in owners
+        )
+        now = timezone.now()
+        statuses = [Mailing.COMPLETED] * 45 + [Mailing.STARTED] * 4 + [Mailing.CREATED]
+        for offset in range(0, total, SEED_BATCH_SIZE):
+            Mailing.objects.bulk_create(
+                Mailing(
+                    owner=owners[i % len(owners)],
+                    message=messages[i % len(owners)],
+                    start_time=now - timedelta(days=30),
+                    status=statuses[i % len(statuses)],
+                    is_active=i % 7 != 0,
+                    next_run=now + timedelta(minutes=i % 1440 - 60),
+                )
+                for i in range(offset, min(offset + SEED_BATCH_SIZE, total))
+            )
+
+        mailing_ids = list(
+            Mailing.objects.filter(owner__in=owners).values_list("id", flat=True)
+        )
+        for offset in range(0, options["attempts"], SEED_BATCH_SIZE):
+            Attempt.objects.bulk_create(
+                Attempt(mailing_id=mailing_ids[i % len(mailing_ids)], status="success")
+                for i in range(
+                    offset, min(offset + SEED_BATCH_SIZE, options["attempts"])
+                )
+            )
+        self.stdout.write(
+            f"Создано {total} рассылок и {options['attempts']} попыток "
+            f"за {time.perf_counter() - started:.1f} с"
+        )
+        return owners
+
+    def explain_queries(self, owner):
+        """Горячие запросы сервиса: подпись и queryset"""
+        mailing = Mailing.objects.filter(owner=owner).order_by("id").first()
+        return [
+            (
+                "Наступившие рассылки (send_mail, планировщик)",
+                due_mailings().order_by("next_run")[:100],
+            ),
+            (
+                "Рассылки владельца, первая страница",
+                Mailing.objects.filter(owner=owner).order_by("-id")[:51],
+            ),
+            (
+                "Клиенты владельца, первая страница",
+                Client.objects.filter(owner=owner).order_by("id")[:51],
+            ),
+            (
+                "История попыток рассылки",
+                Attempt.objects.filter(mailing=mailing).order_by("-attempt_time")[:51],
+            ),
+            (
+                "История попыток владельца",
+                Attempt.objects.filter(mailing__owner=owner).order_by(
+                    "-attempt_time", "-id"
+                )[:51],
+            ),
+        ]
+
+    def print_plans(self, title, owner):
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+        for label, queryset in self.explain_queries(owner):
+            self.stdout.write(self.style.MIGRATE_LABEL(label))
+            self.stdout.write(queryset.explain(analyze=True))
+            self.stdout.write("")
+
+    def bench_explain(self, owner, options):
+        """EXPLAIN ANALYZE горячих запросов без составных индексов и с ними"""
+        if connection.vendor != "postgresql":
+            raise CommandError(
+                "Замер планов запросов поддерживается только в PostgreSQL"
+            )
+
+        owners = self.seed_owners(owner, options)
+        try:
+            indexes = [
+                (model, index)
+                for model in (Client, Message, Mailing, Attempt)
+                for index in model._meta.indexes
+            ]
+            connection.cursor().execute("ANALYZE")
+            # В PostgreSQL DDL транзакционно: индексы удаляются только на
+            # время замера "до" и возвращаются откатом
+            with transaction.atomic():
+                with connection.schema_editor(atomic=False) as editor:
+                    for model, index in indexes:
+                        editor.remove_index(model, index)
+                self.print_plans("До: только индексы внешних ключей", owner)
+                transaction.set_rollback(True)
+            self.print_plans("После: составные и частичные индексы", owner)
+        finally:
+            if not options["keep"]:
+                User.objects.filter(pk__in=[o.pk for o in owners[1:]]).delete()
+
+    def bench_render(self, owner, options):
+        """Подстановка полей клиента: писем в секунду"""
+        mailing = self.seed_mailing(owner, options["clients"])
+        recipients = list(mailing.iter_recipients())
+        subject = "{{ full_name }}, новости недели"
+        body = "Здравствуйте, {{ full_name }}!\n\n" + "Текст письма " * 20
+
+        def render(make_message):
+            started = time.perf_counter()
+            for recipient in recipients:
+                make_message().render(recipient)
+            return len(recipients) / (time.perf_counter() - started)
+
+        compiled = PersonalizedMessage(subject, body)
+        plain = PersonalizedMessage(mailing.message.subject, mailing.message.body)
+        for label, make_message in (
+            ("без полей", lambda: plain),
+            ("шаблон на каждое письмо", lambda: PersonalizedMessage(subject, body)),
+            ("шаблон один раз", lambda: compiled),
+        ):
+            self.stdout.write(f"{label:<30} {render(make_message):12.0f} писем/с")
+
+    def bench_mime(self, owner, options):
+        """Процессорное время на сборку MIME: каждое письмо заново или
+        из общего PrebuiltPayload
+        """
+        emails = [f"client{i}@example{i % 100}.com" for i in range(options["clients"])]
+        subject = "Новости недели: скидки и акции"
+        body = "Здравствуйте! Текст письма с кириллицей. " * 50
+        from_email = "noreply@example.com"
+
+        def build(make_message):
+            started = time.process_time()
+            for email in emails:
+                # Бэкенд SMTP сериализует письмо так же
+                make_message(email).message().as_bytes(linesep="\r\n")
+            return time.process_time() - started
+
+        rebuilt = build(lambda email: EmailMessage(subject, body, from_email, [email]))
+        payload = PrebuiltPayload(subject, body, from_email)
+        prebuilt = build(payload.build)
+        for label, elapsed in (
+            ("EmailMessage на каждое письмо", rebuilt),
+            ("PrebuiltPayload", prebuilt),
+        ):
+            self.stdout.write(
+                f"{label:<30} {elapsed:8.2f} с CPU   {len(emails) / elapsed:10.0f} писем/с"
+            )
+        self.stdout.write(
+            f"Сэкономлено {rebuilt - prebuilt:.2f} с CPU "
+            f"({(1 - prebuilt / rebuilt) * 100:.0f}%)"
+        )
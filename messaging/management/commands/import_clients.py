@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from messaging.imports import (
+    ClientImporter,
+    ImportFileError,
+    ImportReport,
+    read_rows,
+)
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Импорт клиентов пользователя из CSV/XLSX (колонки email, full_name, comment)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Путь к файлу CSV или XLSX")
+        parser.add_argument("--owner", required=True, help="Email владельца клиентов")
+        parser.add_argument(
+            "--batch-size", type=int, help="Строк в одной пачке проверки и вставки"
+        )
+
+    def handle(self, *args, **options):
+        try:
+            owner = User.objects.get(email=options["owner"])
+        except User.DoesNotExist:
+            raise CommandError(f"Пользователь {options['owner']} не найден")
+
+        importer = ClientImporter(owner, batch_size=options["batch_size"])
+        report = ImportReport()
+        try:
+            with open(options["path"], "rb") as file:
+                for report in importer.progress(read_rows(file, options["path"])):
+                    self.stdout.write(str(report))
+        except (OSError, ImportFileError) as e:
+            raise CommandError(str(e))
+
+        for line, error in report.errors:
+            self.stderr.write(f"Строка {line}: {error}")
+        self.stdout.write(self.style.SUCCESS("Импорт завершен"))
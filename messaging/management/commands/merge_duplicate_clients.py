@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from messaging.caching import bump_generation
+from messaging.dedup import MERGE_BATCH_SIZE, merge_duplicate_clients
+from messaging.models import Client
+
+
+class Command(BaseCommand):
+    help = (
+        "Слить клиентов одного владельца с одинаковым email и перенести "
+        "их рассылки на оставшегося клиента"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=MERGE_BATCH_SIZE,
+            help="Сколько дубликатов переносить за одну транзакцию",
+        )
+
+    def handle(self, *args, **options):
+        merged = merge_duplicate_clients(batch_size=options["batch_size"])
+        # Email нормализуется через QuerySet.update() без сигналов
+        bump_generation(*Client.objects.values_list("owner_id", flat=True).distinct())
+        self.stdout.write(self.style.SUCCESS(f"Удалено дубликатов: {merged}"))
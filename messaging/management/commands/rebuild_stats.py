@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from messaging.stats import rebuild_daily_stats
+
+
+class Command(BaseCommand):
+    help = "Пересчитать дневную статистику пользователей по истории попыток"
+
+    def handle(self, *args, **options):
+        count = rebuild_daily_stats()
+        self.stdout.write(self.style.SUCCESS(f"Пересчитано дней: {count}"))
@@ -0,0 +1,64 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from messaging.scheduler import (
+    MailingTimerQueue,
+    claim_due_mailings,
+    dispatch_mailings,
+)
+
+
+class Command(BaseCommand):
+    help = "Демон планировщика: запускает рассылки точно в срок"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=settings.SCHEDULER_POLL_INTERVAL,
+            help="Как часто проверять журнал изменений в кеше, секунд",
+        )
+        parser.add_argument(
+            "--resync-interval",
+            type=float,
+            default=settings.SCHEDULER_RESYNC_INTERVAL,
+            help="Как часто полностью перечитывать расписание из БД, секунд",
+        )
+
+    def handle(self, *args, **options):
+        queue = MailingTimerQueue()
+        queue.reload()
+        resync_at = time.monotonic() + options["resync_interval"]
+        self.stdout.write(f"Планировщик запущен, рассылок в расписании: {len(queue)}")
+
+        try:
+            while True:
+                close_old_connections()
+                if time.monotonic() >= resync_at:
+                    queue.reload()
+                    resync_at = time.monotonic() + options["resync_interval"]
+                else:
+                    queue.refresh()
+
+                due_ids = queue.pop_due(timezone.now())
+                if due_ids:
+                    self.dispatch(due_ids)
+
+                deadline = queue.next_deadline()
+                timeout = options["poll_interval"]
+                if deadline is not None:
+                    until_deadline = (deadline - timezone.now()).total_seconds()
+                    timeout = max(0, min(timeout, until_deadline))
+                time.sleep(timeout)
+        except KeyboardInterrupt:
+            self.stdout.write("Планировщик остановлен")
+
+    def dispatch(self, mailing_ids):
+        # Рассылку могли изменить или забрать другим процессом после загрузки
+        claimed = claim_due_mailings(ids=mailing_ids, limit=len(mailing_ids))
+        for mailing_id in dispatch_mailings(claimed):
+            self.stdout.write(f"Started mailing ID {mailing_id}")
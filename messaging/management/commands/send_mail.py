@@ -1,34 +1,26 @@
 from django.core.management.base import BaseCommand
-from django.utils import timezone
-from messaging.models import Mailing
-from messaging.tasks import send_mailing
+from messaging.scheduler import claim_due_mailings, dispatch_mailings
 
 
 class Command(BaseCommand):
     help = "Send scheduled messages"
 
     def handle(self, *args, **options):
-        now = timezone.now()
-
-        mailings = Mailing.objects.filter(
-            start_time__lte=now, status=Mailing.CREATED, is_active=True
-        ).exclude(end_time__lt=now)
-
         count = 0
 
-        for mailing in mailings:
-            try:
-                mailing.status = Mailing.STARTED
-                mailing.save()
-                send_mailing.delay(mailing.id)
+        # Забираем рассылки пачками, пока очередь не опустеет; параллельно
+        # запущенные команды не получат одну и ту же рассылку
+        while True:
+            claimed = claim_due_mailings()
+            if not claimed:
+                break
+            dispatched = dispatch_mailings(claimed)
+            if not dispatched:
+                # Брокер недоступен — остальные рассылки отправит следующий запуск
+                self.stderr.write("Failed to queue mailings, broker is unavailable")
+                break
+            for mailing_id in dispatched:
                 count += 1
+                self.stdout.write(f"Started mailing ID {mailing_id}")
 
-                self.stdout.write(f"Started mailing ID {mailing.id}")
-            except Exception as e:
-                self.stdout.write(
-                    self.style.ERROR(
-                        f"Error starting mailing ID {mailing.id}: {str(e)}"
-                    )
-                )
-
-        self.stdout.write(self.style.SUCCESS(f"Successfully started {count} mailings"))
\ No newline at end of file
+        self.stdout.write(self.style.SUCCESS(f"Successfully started {count} mailings"))
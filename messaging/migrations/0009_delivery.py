@@ -0,0 +1,103 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:46
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("messaging", "0008_alter_mailing_options"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="attempt",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "В процессе"),
+                    ("success", "Успешно"),
+                    ("failure", "Неуспешно"),
+                ],
+                max_length=10,
+                verbose_name="Статус попытки",
+            ),
+        ),
+        migrations.CreateModel(
+            name="Delivery",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("email", models.EmailField(max_length=254, verbose_name="Email")),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("success", "Успешно"), ("failure", "Неуспешно")],
+                        max_length=10,
+                        verbose_name="Статус",
+                    ),
+                ),
+                (
+                    "smtp_code",
+                    models.PositiveSmallIntegerField(
+                        blank=True, null=True, verbose_name="Код ответа SMTP"
+                    ),
+                ),
+                (
+                    "server_response",
+                    models.TextField(blank=True, verbose_name="Ответ сервера"),
+                ),
+                (
+                    "sent_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, verbose_name="Время отправки"
+                    ),
+                ),
+                (
+                    "attempt",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="deliveries",
+                        to="messaging.attempt",
+                        verbose_name="Попытка",
+                    ),
+                ),
+                (
+                    "client",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to="messaging.client",
+                        verbose_name="Клиент",
+                    ),
+                ),
+                (
+                    "mailing",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="messaging.mailing",
+                        verbose_name="Рассылка",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Доставка",
+                "verbose_name_plural": "Доставки",
+                "indexes": [
+                    models.Index(
+                        fields=["mailing", "status", "sent_at"],
+                        name="delivery_mailing_status_time",
+                    )
+                ],
+            },
+        ),
+    ]
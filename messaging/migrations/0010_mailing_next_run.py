@@ -0,0 +1,27 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:48
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def schedule_created_mailings(apps, schema_editor):
+    Mailing = apps.get_model("messaging", "Mailing")
+    Mailing.objects.filter(status="created").update(next_run=F("start_time"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("messaging", "0009_delivery"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="mailing",
+            name="next_run",
+            field=models.DateTimeField(
+                blank=True, db_index=True, null=True, verbose_name="Следующий запуск"
+            ),
+        ),
+        migrations.RunPython(schedule_created_mailings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:52
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("messaging", "0010_mailing_next_run"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DailyStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField(verbose_name="Дата")),
+                (
+                    "successful_attempts",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Успешных попыток"
+                    ),
+                ),
+                (
+                    "failed_attempts",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Неуспешных попыток"
+                    ),
+                ),
+                (
+                    "messages_sent",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Отправлено писем"
+                    ),
+                ),
+                (
+                    "messages_failed",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Не доставлено писем"
+                    ),
+                ),
+                (
+                    "owner",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Владелец",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Статистика за день",
+                "verbose_name_plural": "Статистика по дням",
+                "ordering": ["-date"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("owner", "date"), name="unique_daily_stats_per_owner"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,70 @@
+from django.db import migrations
+from django.db.models import Case, F, Min, Value, When, Window
+from django.db.models.functions import Lower, Trim
+
+# Сколько дубликатов переносить за один проход
+BATCH_SIZE = 1000
+
+
+# Копия messaging.dedup.merge_duplicate_clients на момент миграции:
+# миграция не должна зависеть от кода приложения, который будет меняться
+
+
+def merge_duplicates(apps, schema_editor):
+    """Сливает клиентов одного владельца с одинаковым email.
+
+    Из каждой группы остается клиент с наименьшим id, связи рассылок и
+    доставки дубликатов переносятся на него, email всех клиентов
+    приводится к нормализованному виду.
+    """
+    Client = apps.get_model("messaging", "Client")
+    Mailing = apps.get_model("messaging", "Mailing")
+    Delivery = apps.get_model("messaging", "Delivery")
+    Through = Mailing.clients.through
+
+    group = [F("owner_id"), Lower(Trim("email"))]
+    duplicates = list(
+        Client.objects.annotate(keeper=Window(Min("id"), partition_by=group))
+        .exclude(id=F("keeper"))
+        .order_by("id")
+        .values_list("id", "keeper")
+    )
+    for start in range(0, len(duplicates), BATCH_SIZE):
+        batch = dict(duplicates[start : start + BATCH_SIZE])
+        links = Through.objects.filter(client_id__in=batch)
+        Through.objects.bulk_create(
+            [
+                Through(mailing_id=mailing_id, client_id=batch[client_id])
+                for mailing_id, client_id in links.values_list(
+                    "mailing_id", "client_id"
+                )
+            ],
+            ignore_conflicts=True,
+        )
+        links.delete()
+        Delivery.objects.filter(client_id__in=batch).update(
+            client_id=Case(
+                *[
+                    When(client_id=pk, then=Value(keeper))
+                    for pk, keeper in batch.items()
+                ]
+            )
+        )
+        Client.objects.filter(id__in=batch).delete()
+
+    Client.objects.exclude(email=Lower(Trim("email"))).update(
+        email=Lower(Trim("email"))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("messaging", "0011_dailystats"),
+    ]
+
+    # Уникальный индекс добавляется следующей миграцией: в PostgreSQL
+    # нельзя менять таблицу в транзакции с отложенными проверками FK
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:59
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("messaging", "0012_merge_duplicate_clients"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name="client",
+            constraint=models.UniqueConstraint(
+                fields=("owner", "email"), name="unique_client_email_per_owner"
+            ),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.3 on 2026-10-18 11:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("messaging", "0013_client_unique_email"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="mailing",
+            name="next_run",
+            field=models.DateTimeField(
+                blank=True, null=True, verbose_name="Следующий запуск"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="attempt",
+            index=models.Index(
+                fields=["mailing", "attempt_time"], name="attempt_mailing_time"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="client",
+            index=models.Index(fields=["owner", "id"], name="client_owner_id"),
+        ),
+        migrations.AddIndex(
+            model_name="mailing",
+            index=models.Index(
+                condition=models.Q(("is_active", True), ("status", "created")),
+                fields=["next_run"],
+                name="mailing_due_next_run",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="mailing",
+            index=models.Index(fields=["owner", "id"], name="mailing_owner_id"),
+        ),
+        migrations.AddIndex(
+            model_name="message",
+            index=models.Index(fields=["owner", "id"], name="message_owner_id"),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.3 on 2026-10-18 11:13
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("messaging", "0014_hot_query_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="mailing",
+            name="envelope_size",
+            field=models.PositiveSmallIntegerField(
+                default=1,
+                help_text="Больше 1 — одно письмо со скрытыми копиями на несколько адресов одного домена. Только для сообщений без полей клиента",
+                validators=[
+                    django.core.validators.MinValueValidator(1),
+                    django.core.validators.MaxValueValidator(100),
+                ],
+                verbose_name="Получателей в одном письме",
+            ),
+        ),
+    ]
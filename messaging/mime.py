@@ -0,0 +1,74 @@
+import copy
+from email.message import Message
+from email.utils import formatdate, make_msgid
+
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.core.mail.utils import DNS_NAME
+
+# Заголовки, которые у каждого получателя свои
+RECIPIENT_HEADERS = ("To", "Date", "Message-ID")
+# To письма, разосланного скрытыми копиями (RFC 5322, 3.4)
+UNDISCLOSED_RECIPIENTS = "undisclosed-recipients:;"
+
+
+class PrebuiltPayload:
+    """MIME-представление письма рассылки, собранное один раз.
+
+    Кодирование темы и текста (кириллица в base64/quoted-printable) и
+    заголовки From, Subject, MIME-Version выполняются при создании объекта.
+    Для получателя копируется готовое сообщение и подставляются только
+    To, Date и Message-ID.
+    """
+
+    def __init__(self, subject, body, from_email):
+        self.subject = subject
+        self.body = body
+        self.from_email = from_email
+        self.mime = EmailMessage(subject, body, from_email).message()
+        for name in RECIPIENT_HEADERS:
+            del self.mime[name]
+
+    def message(self, to=None):
+        """MIME-сообщение для получателей to; без to — для скрытых копий"""
+        msg = copy.copy(self.mime)
+        # copy.copy разделяет список заголовков с образцом — нужен свой
+        msg._headers = list(self.mime._headers)
+        if to:
+            msg["To"] = ", ".join(to)
+        else:
+            # Группа без адресов: SafeMIMEText не пропускает ее как адрес
+            Message.__setitem__(msg, "To", UNDISCLOSED_RECIPIENTS)
+        msg["Date"] = formatdate(localtime=settings.EMAIL_USE_LOCALTIME)
+        msg["Message-ID"] = make_msgid(domain=DNS_NAME)
+        return msg
+
+    def build(self, email, connection=None):
+        """Письмо одному получателю"""
+        return PrebuiltEmailMessage(self, to=[email], connection=connection)
+
+    def build_envelope(self, emails, connection=None):
+        """Одно письмо нескольким получателям в скрытых копиях"""
+        return PrebuiltEmailMessage(self, bcc=emails, connection=connection)
+
+
+class PrebuiltEmailMessage(EmailMessage):
+    """EmailMessage, который отдает готовый MIME из PrebuiltPayload.
+
+    Бэкенды почты (SMTP, file, locmem) получают MIME через message(),
+    поэтому работают с ним как с обычным письмом.
+    """
+
+    def __init__(self, payload, to=None, bcc=None, connection=None):
+        super().__init__(
+            payload.subject,
+            payload.body,
+            payload.from_email,
+            to=to,
+            bcc=bcc,
+            connection=connection,
+        )
+        self.payload = payload
+
+    def message(self):
+        return self.payload.message(self.to)
@@ -1,5 +1,10 @@
-from django.core.exceptions import PermissionDenied
+import base64
+import json
+
+from django.core.exceptions import PermissionDenied, ValidationError
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.db.models import Q
+from django.http import Http404
 
 
 class OwnerRequiredMixin(LoginRequiredMixin):
@@ -7,4 +12,115 @@ class OwnerRequiredMixin(LoginRequiredMixin):
         obj = self.get_object()
         if obj.owner != request.user:
             raise PermissionDenied
-        return super().dispatch(request, *args, **kwargs)
\ No newline at end of file
+        return super().dispatch(request, *args, **kwargs)
+
+
+class KeysetPage:
+    """Страница keyset-пагинации: вместо номера — курсоры соседних страниц"""
+
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def encode_cursor(direction, obj, field="id"):
+    """Курсор страницы: направление и значения (field, id) граничной строки"""
+    value = getattr(obj, field.lstrip("-"))
+    if hasattr(value, "isoformat"):
+        value = value.isoformat()
+    data = json.dumps([direction, value, obj.pk]).encode()
+    return base64.urlsafe_b64encode(data).decode()
+
+
+def paginate_keyset(queryset, cursor, page_size, field="id"):
+    """Возвращает KeysetPage для queryset, упорядоченного по field и id.
+
+    Следующая страница выбирается условием (field, id) > курсора, а не
+    OFFSET, поэтому глубокие страницы стоят столько же, сколько первая.
+    field со знаком "-" задает сортировку по убыванию.
+    """
+    descending = field.startswith("-")
+    name = field.lstrip("-")
+    order = [field, "-id" if descending else "id"]
+
+    backward = False
+    if cursor:
+        meta = queryset.model._meta
+        try:
+            direction, value, pk = json.loads(base64.urlsafe_b64decode(cursor))
+            # Значения приводятся к типам полей, иначе подделанный курсор
+            # дошел бы до filter() и вызвал ошибку сервера
+            pk = meta.pk.to_python(pk)
+            value = meta.get_field(name).to_python(value)
+            if direction not in ("next", "prev") or None in (pk, value):
+                raise ValueError
+        except (TypeError, ValueError, ValidationError):
+            raise Http404("Некорректный курсор страницы")
+        backward = direction == "prev"
+        # Назад идем в обратном порядке и разворачиваем результат
+        after = descending == backward
+        lookup = "gt" if after else "lt"
+        condition = Q(**{f"id__{lookup}": pk})
+        if name != "id":
+            condition = Q(**{f"{name}__{lookup}": value}) | (
+                Q(**{name: value}) & condition
+            )
+        queryset = queryset.filter(condition)
+        if backward:
+            order = [term[1:] if term.startswith("-") else f"-{term}" for term in order]
+
+    rows = list(queryset.order_by(*order)[: page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backward:
+        rows.reverse()
+
+    has_next = has_more if not backward else bool(cursor)
+    has_previous = has_more if backward else bool(cursor)
+    return KeysetPage(
+        rows,
+        next_cursor=(
+            encode_cursor("next", rows[-1], name) if has_next and rows else None
+        ),
+        previous_cursor=(
+            encode_cursor("prev", rows[0], name) if has_previous and rows else None
+        ),
+    )
+
+
+class KeysetPaginationMixin:
+    """Keyset-пагинация для ListView по (keyset_field, id) вместо OFFSET.
+
+    В шаблон передаются привычные page_obj и is_paginated; ссылки на
+    соседние страницы строятся из page_obj.next_cursor и
+    page_obj.previous_cursor.
+    """
+
+    paginate_by = 50
+    keyset_field = "id"
+    cursor_kwarg = "cursor"
+
+    def paginate_queryset(self, queryset, page_size):
+        page = paginate_keyset(
+            queryset,
+            self.request.GET.get(self.cursor_kwarg),
+            page_size,
+            self.keyset_field,
+        )
+        return None, page, page.object_list, page.has_other_pages()
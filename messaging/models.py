@@ -1,8 +1,10 @@
-from django.core.mail import send_mail
+from django.conf import settings
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 from django.utils import timezone
 
-from config import settings
+from messaging.dedup import normalize_email
+from messaging.personalization import RECIPIENT_FIELDS
 from users.models import User
 
 
@@ -21,10 +23,28 @@ class Client(models.Model):
             ("can_view_client", "Can view client"),
             ("can_block_client", "Can block client"),
         ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["owner", "email"], name="unique_client_email_per_owner"
+            )
+        ]
+        indexes = [
+            # Список клиентов владельца с keyset-пагинацией по id
+            models.Index(fields=["owner", "id"], name="client_owner_id"),
+        ]
 
     def __str__(self):
         return self.full_name
 
+    def clean(self):
+        self.email = normalize_email(self.email)
+
+    def save(self, *args, **kwargs):
+        # Email хранится нормализованным, чтобы уникальность не зависела
+        # от регистра и пробелов
+        self.email = normalize_email(self.email)
+        super().save(*args, **kwargs)
+
 
 class Message(models.Model):
     subject = models.CharField(max_length=255, verbose_name="Тема письма")
@@ -40,6 +60,9 @@ class Message(models.Model):
             ("can_view_message", "Can view message"),
             ("can_disable_message", "Can disable message"),
         ]
+        indexes = [
+            models.Index(fields=["owner", "id"], name="message_owner_id"),
+        ]
 
     def __str__(self):
         return self.subject
@@ -84,6 +107,16 @@ class Mailing(models.Model):
         User, on_delete=models.CASCADE, verbose_name="Владелец", null=True
     )
     is_active = models.BooleanField(default=True, verbose_name="Активна")
+    next_run = models.DateTimeField(
+        null=True, blank=True, verbose_name="Следующий запуск"
+    )
+    envelope_size = models.PositiveSmallIntegerField(
+        default=1,
+        validators=[MinValueValidator(1), MaxValueValidator(100)],
+        verbose_name="Получателей в одном письме",
+        help_text="Больше 1 — одно письмо со скрытыми копиями на несколько "
+        "адресов одного домена. Только для сообщений без полей клиента",
+    )
 
     class Meta:
         verbose_name = "Рассылка"
@@ -93,9 +126,27 @@ class Mailing(models.Model):
             ("can_view_all", "Can view all mailings"),
             ("can_finish_mailing", "Can finish any mailing"),
         ]
+        indexes = [
+            # Планировщик выбирает только созданные активные рассылки —
+            # частичный индекс не содержит завершенных и отключенных
+            models.Index(
+                fields=["next_run"],
+                condition=models.Q(status="created", is_active=True),
+                name="mailing_due_next_run",
+            ),
+            models.Index(fields=["owner", "id"], name="mailing_owner_id"),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Новая рассылка планируется на время начала
+        if self.next_run is None and self.status == self.CREATED:
+            self.next_run = self.start_time
+            if "update_fields" in kwargs and kwargs["update_fields"] is not None:
+                kwargs["update_fields"] = {*kwargs["update_fields"], "next_run"}
+        super().save(*args, **kwargs)
 
-    def send(self):
-        """Метод для отправки рассылки всем клиентам"""
+    def check_can_send(self):
+        """Проверяет, что рассылку можно отправить, иначе ValueError"""
         if self.status != self.CREATED:
             raise ValueError(
                 "Рассылка может быть отправлена только в статусе 'Создана'"
@@ -107,46 +158,31 @@ class Mailing(models.Model):
         if self.end_time and timezone.now() > self.end_time:
             raise ValueError("Время окончания рассылки уже прошло")
 
-        # Получаем всех клиентов рассылки
-        clients = self.clients.all()
-        if not clients:
-            raise ValueError("Нет клиентов для отправки")
-
-        # Подготавливаем сообщение
-        subject = self.message.subject
-        message = self.message.body
-        from_email = settings.DEFAULT_FROM_EMAIL
-
-        # Отправляем каждому клиенту
-        for client in clients:
-            try:
-                send_mail(
-                    subject=subject,
-                    message=message,
-                    from_email=from_email,
-                    recipient_list=[client.email],
-                    fail_silently=False,
-                )
-
-            except Exception as e:
-                print(f"Ошибка при отправке клиенту {client.email}: {str(e)}")
-                continue
-
-        # Обновляем статус рассылки
-        self.status = self.COMPLETED
-        self.save()
-
-        return len(clients)
+    def iter_recipients(self, **filters):
+        """Потоково отдает получателей рассылки словарями полей
+        RECIPIENT_FIELDS (id, email, full_name).
+
+        Клиенты не загружаются в память целиком: iterator() читает их
+        порциями, на PostgreSQL — через серверный курсор.
+        """
+        return (
+            self.clients.filter(**filters)
+            .order_by("id")
+            .values(*RECIPIENT_FIELDS)
+            .iterator(chunk_size=settings.MAILING_ITERATOR_CHUNK_SIZE)
+        )
 
     def __str__(self):
         return f"Рассылка {self.id} - {self.get_status_display()}"
 
 
 class Attempt(models.Model):
+    PENDING = "pending"
     SUCCESS = "success"
     FAILURE = "failure"
 
     STATUS_CHOICES = [
+        (PENDING, "В процессе"),
         (SUCCESS, "Успешно"),
         (FAILURE, "Неуспешно"),
     ]
@@ -165,6 +201,104 @@ class Attempt(models.Model):
     class Meta:
         verbose_name = "Попытка рассылки"
         verbose_name_plural = "Попытки рассылки"
+        indexes = [
+            # История попыток рассылки и пересчет статистики по дням
+            models.Index(
+                fields=["mailing", "attempt_time"], name="attempt_mailing_time"
+            ),
+        ]
+
+    def finish(self, sent, failed):
+        """Фиксирует итог попытки по числу отправленных и неуспешных писем"""
+        from messaging.stats import record_attempt
+
+        self.status = self.SUCCESS if sent else self.FAILURE
+        self.server_response = f"Отправлено: {sent}, ошибок: {failed}"
+        self.save(update_fields=["status", "server_response"])
+        record_attempt(self, sent, failed)
+
+    def __str__(self):
+        return f"Попытка {self.id} - {self.get_status_display()}"
+
+
+class Delivery(models.Model):
+    """Результат отправки письма одному получателю в рамках попытки"""
+
+    SUCCESS = Attempt.SUCCESS
+    FAILURE = Attempt.FAILURE
+
+    STATUS_CHOICES = [
+        (SUCCESS, "Успешно"),
+        (FAILURE, "Неуспешно"),
+    ]
+
+    attempt = models.ForeignKey(
+        Attempt,
+        on_delete=models.CASCADE,
+        related_name="deliveries",
+        verbose_name="Попытка",
+    )
+    mailing = models.ForeignKey(
+        Mailing, on_delete=models.CASCADE, verbose_name="Рассылка"
+    )
+    client = models.ForeignKey(
+        Client, on_delete=models.SET_NULL, null=True, verbose_name="Клиент"
+    )
+    email = models.EmailField(verbose_name="Email")
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, verbose_name="Статус"
+    )
+    smtp_code = models.PositiveSmallIntegerField(
+        null=True, blank=True, verbose_name="Код ответа SMTP"
+    )
+    server_response = models.TextField(blank=True, verbose_name="Ответ сервера")
+    sent_at = models.DateTimeField(default=timezone.now, verbose_name="Время отправки")
+
+    class Meta:
+        verbose_name = "Доставка"
+        verbose_name_plural = "Доставки"
+        indexes = [
+            models.Index(
+                fields=["mailing", "status", "sent_at"],
+                name="delivery_mailing_status_time",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.email} - {self.get_status_display()}"
+
+
+class DailyStats(models.Model):
+    """Счетчики попыток и писем владельца за день.
+
+    Обновляются при завершении каждой попытки, поэтому страница
+    статистики не пересчитывает всю историю Attempt.
+    """
+
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, verbose_name="Владелец")
+    date = models.DateField(verbose_name="Дата")
+    successful_attempts = models.PositiveIntegerField(
+        default=0, verbose_name="Успешных попыток"
+    )
+    failed_attempts = models.PositiveIntegerField(
+        default=0, verbose_name="Неуспешных попыток"
+    )
+    messages_sent = models.PositiveIntegerField(
+        default=0, verbose_name="Отправлено писем"
+    )
+    messages_failed = models.PositiveIntegerField(
+        default=0, verbose_name="Не доставлено писем"
+    )
+
+    class Meta:
+        verbose_name = "Статистика за день"
+        verbose_name_plural = "Статистика по дням"
+        ordering = ["-date"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["owner", "date"], name="unique_daily_stats_per_owner"
+            ),
+        ]
 
     def __str__(self):
-        return f"Попытка {self.id} - {self.get_status_display()}"
\ No newline at end of file
+        return f"{self.owner} - {self.date}"
@@ -0,0 +1,44 @@
+from django.template import Context, Engine
+
+# Поля получателя, доступные в теме и тексте письма: {{ full_name }}, {{ email }}
+RECIPIENT_FIELDS = ("id", "email", "full_name")
+
+# Письма — обычный текст, HTML-экранирование не нужно
+engine = Engine(autoescape=False)
+
+
+def has_placeholders(text):
+    return "{{" in text or "{%" in text
+
+
+class PersonalizedMessage:
+    """Тема и текст письма с полями получателя, скомпилированные один раз.
+
+    Шаблоны разбираются при создании объекта, а render() только подставляет
+    словарь получателя (например, из values()). Текст без {{ }} и {% %}
+    отдается как есть, без шаблонизатора.
+    """
+
+    def __init__(self, subject, body):
+        self.subject = subject
+        self.body = body
+        self._subject = (
+            engine.from_string(subject) if has_placeholders(subject) else None
+        )
+        self._body = engine.from_string(body) if has_placeholders(body) else None
+
+    @property
+    def is_personalized(self):
+        return self._subject is not None or self._body is not None
+
+    def render(self, recipient):
+        """Тема и текст письма для получателя"""
+        if not self.is_personalized:
+            return self.subject, self.body
+        context = Context(recipient, autoescape=False)
+        subject = self.subject
+        if self._subject is not None:
+            # Перевод строки в заголовке письма недопустим
+            subject = " ".join(self._subject.render(context).split())
+        body = self._body.render(context) if self._body is not None else self.body
+        return subject, body
@@ -0,0 +1,68 @@
+import time
+
+from django.core.cache import cache
+
+# Счетчики живут дольше самой долгой рассылки, затем удаляются кешем
+PROGRESS_TIMEOUT = 60 * 60 * 24
+
+FIELDS = ("owner", "total", "sent", "failed", "started_at", "finished_at")
+
+
+def _key(mailing_id, field):
+    return f"mailing:{mailing_id}:progress:{field}"
+
+
+def start_progress(mailing_id, owner_id, total):
+    """Сбрасывает счетчики прогресса рассылки перед отправкой"""
+    cache.set_many(
+        {
+            _key(mailing_id, "owner"): owner_id,
+            _key(mailing_id, "total"): total,
+            _key(mailing_id, "sent"): 0,
+            _key(mailing_id, "failed"): 0,
+            _key(mailing_id, "started_at"): time.time(),
+        },
+        PROGRESS_TIMEOUT,
+    )
+    cache.delete(_key(mailing_id, "finished_at"))
+
+
+def add_progress(mailing_id, sent=0, failed=0):
+    """Атомарно увеличивает счетчики отправленных и неуспешных писем"""
+    for field, value in (("sent", sent), ("failed", failed)):
+        if not value:
+            continue
+        key = _key(mailing_id, field)
+        try:
+            cache.incr(key, value)
+        except ValueError:
+            # Счетчик истек или не был создан
+            if not cache.add(key, value, PROGRESS_TIMEOUT):
+                cache.incr(key, value)
+
+
+def finish_progress(mailing_id):
+    cache.set(_key(mailing_id, "finished_at"), time.time(), PROGRESS_TIMEOUT)
+
+
+def get_progress(mailing_id):
+    """Возвращает словарь с прогрессом рассылки или None, если отправки не было"""
+    values = cache.get_many([_key(mailing_id, field) for field in FIELDS])
+    if _key(mailing_id, "started_at") not in values:
+        return None
+    progress = {field: values.get(_key(mailing_id, field)) for field in FIELDS}
+    progress["sent"] = progress["sent"] or 0
+    progress["failed"] = progress["failed"] or 0
+    progress["total"] = progress["total"] or 0
+
+    done = progress["sent"] + progress["failed"]
+    finished_at = progress["finished_at"]
+    elapsed = (finished_at or time.time()) - progress["started_at"]
+    if finished_at or done >= progress["total"]:
+        progress["eta"] = 0
+    elif done and elapsed > 0:
+        progress["eta"] = round((progress["total"] - done) / (done / elapsed), 1)
+    else:
+        progress["eta"] = None
+    progress["finished"] = finished_at is not None
+    return progress
@@ -0,0 +1,258 @@
+import heapq
+import logging
+from datetime import timedelta
+
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from messaging.caching import bump_generation
+from messaging.models import Mailing
+
+logger = logging.getLogger(__name__)
+
+CHANGES_VERSION_KEY = "scheduler:changes:version"
+CHANGES_TIMEOUT = 60 * 60
+
+FREQUENCY_DELTAS = {
+    Mailing.DAILY: relativedelta(days=1),
+    Mailing.WEEKLY: relativedelta(weeks=1),
+    Mailing.MONTHLY: relativedelta(months=1),
+}
+
+
+def next_run_after(mailing, after):
+    """Ближайший запуск рассылки строго после after или None для разовой.
+
+    Запуски отсчитываются от start_time, поэтому ежемесячная рассылка
+    не смещается по дням месяца, а пропущенные запуски не досылаются.
+    """
+    delta = FREQUENCY_DELTAS.get(mailing.frequency)
+    if delta is None:
+        return None
+    step = 1
+    if mailing.frequency != Mailing.MONTHLY:
+        # Для дней и недель сразу перескакиваем к нужному шагу
+        period = (mailing.start_time + delta) - mailing.start_time
+        step = max(1, int((after - mailing.start_time) / period))
+    candidate = mailing.start_time + delta * step
+    while candidate <= after:
+        step += 1
+        candidate = mailing.start_time + delta * step
+    return candidate
+
+
+def due_mailings(now=None):
+    """Рассылки, время запуска которых наступило.
+
+    Выборка идет по частичному индексу mailing_due_next_run, а не полным
+    просмотром таблицы.
+    """
+    now = now or timezone.now()
+    return Mailing.objects.filter(
+        status=Mailing.CREATED, is_active=True, next_run__lte=now
+    ).filter(Q(end_time__isnull=True) | Q(end_time__gte=now))
+
+
+def reschedule(mailing, now=None):
+    """После отправки возвращает рассылку в очередь на следующий запуск.
+
+    Если следующего запуска нет или он позже end_time, рассылка
+    завершается. Пока шла отправка, рассылку могли завершить или
+    отключить вручную, поэтому UPDATE условный: меняется только все еще
+    запущенная активная рассылка.
+    """
+    now = now or timezone.now()
+    status = Mailing.CREATED
+    next_run = next_run_after(mailing, now)
+    if next_run is None or (mailing.end_time and next_run > mailing.end_time):
+        status = Mailing.COMPLETED
+        next_run = None
+    updated = Mailing.objects.filter(
+        pk=mailing.pk, status=Mailing.STARTED, is_active=True
+    ).update(status=status, next_run=next_run)
+    if updated:
+        mailing.status = status
+        mailing.next_run = next_run
+        mailings_changed([mailing.pk])
+    return mailing.next_run
+
+
+def claim_mailing(mailing_id):
+    """Атомарно переводит рассылку из 'Создана' в 'Запущена'.
+
+    Условный UPDATE выполняется одним запросом, поэтому из нескольких
+    конкурирующих процессов рассылку получает ровно один.
+    """
+    claimed = Mailing.objects.filter(pk=mailing_id, status=Mailing.CREATED).update(
+        status=Mailing.STARTED
+    )
+    if claimed:
+        mailings_changed([mailing_id])
+    return bool(claimed)
+
+
+def claim_due_mailings(now=None, limit=None, ids=None):
+    """Забирает до limit наступивших рассылок, возвращает их id.
+
+    На PostgreSQL строки блокируются через SELECT ... FOR UPDATE SKIP
+    LOCKED: параллельные планировщики и воркеры разбирают очередь, не
+    дожидаясь друг друга и не получая одну рассылку дважды. На остальных
+    БД каждая рассылка забирается отдельным условным UPDATE.
+    """
+    limit = limit or settings.SCHEDULER_CLAIM_BATCH_SIZE
+    queryset = due_mailings(now).order_by("next_run")
+    if ids is not None:
+        queryset = queryset.filter(id__in=ids)
+
+    if not connection.features.has_select_for_update_skip_locked:
+        candidates = list(queryset.values_list("id", flat=True)[:limit])
+        return [pk for pk in candidates if claim_mailing(pk)]
+
+    with transaction.atomic():
+        claimed = list(
+            queryset.select_for_update(skip_locked=True).values_list("id", flat=True)[
+                :limit
+            ]
+        )
+        Mailing.objects.filter(id__in=claimed).update(status=Mailing.STARTED)
+    mailings_changed(claimed)
+    return claimed
+
+
+def dispatch_mailings(mailing_ids):
+    """Ставит отправку забранных рассылок в очередь Celery.
+
+    Рассылка, которую не удалось поставить в очередь, возвращается в
+    расписание через SCHEDULER_RETRY_DELAY секунд, а не сразу: иначе
+    планировщик забирал бы ее снова и снова, пока брокер недоступен.
+    """
+    from messaging.tasks import send_mailing
+
+    dispatched = []
+    for pk in mailing_ids:
+        try:
+            send_mailing.delay(pk)
+            dispatched.append(pk)
+        except Exception:
+            # Брокер недоступен — возвращаем рассылку в очередь
+            logger.exception("Не удалось поставить рассылку %s в очередь", pk)
+            retry_at = timezone.now() + timedelta(
+                seconds=settings.SCHEDULER_RETRY_DELAY
+            )
+            Mailing.objects.filter(pk=pk, status=Mailing.STARTED).update(
+                status=Mailing.CREATED, next_run=retry_at
+            )
+            mailings_changed([pk])
+    return dispatched
+
+
+def mailings_changed(mailing_ids):
+    """Замена сигналов post_save для изменений через QuerySet.update()"""
+    if not mailing_ids:
+        return
+    for pk in mailing_ids:
+        notify_mailing_changed(pk)
+    bump_generation(
+        *Mailing.objects.filter(id__in=mailing_ids)
+        .values_list("owner_id", flat=True)
+        .distinct()
+    )
+
+
+def notify_mailing_changed(mailing_id):
+    """Записывает изменение рассылки в журнал, который читает run_scheduler.
+
+    Журнал хранится в кеше: счетчик версий и по ключу на каждую версию,
+    поэтому демон узнает об изменениях без запросов к БД.
+    """
+    cache.add(CHANGES_VERSION_KEY, 0, None)
+    try:
+        version = cache.incr(CHANGES_VERSION_KEY)
+    except ValueError:
+        # Ключ вытеснен из кеша между add и incr — демон перечитает все
+        return
+    cache.set(f"scheduler:changes:{version}", mailing_id, CHANGES_TIMEOUT)
+
+
+class MailingTimerQueue:
+    """Куча ближайших запусков рассылок для демона run_scheduler.
+
+    Устаревшие записи из кучи не удаляются, а пропускаются при извлечении:
+    актуальное время запуска каждой рассылки хранится в словаре.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._scheduled = {}
+        self.version = None
+
+    def __len__(self):
+        return len(self._scheduled)
+
+    def reload(self):
+        """Полностью перечитывает расписание из БД"""
+        self.version = cache.get(CHANGES_VERSION_KEY, 0)
+        rows = Mailing.objects.filter(
+            status=Mailing.CREATED, is_active=True, next_run__isnull=False
+        ).values_list("id", "next_run")
+        self._scheduled = dict(rows)
+        self._heap = [(next_run, pk) for pk, next_run in self._scheduled.items()]
+        heapq.heapify(self._heap)
+
+    def refresh(self):
+        """Применяет изменения из журнала, возвращает число обновленных рассылок"""
+        version = cache.get(CHANGES_VERSION_KEY, 0)
+        if self.version is None or version < self.version:
+            self.reload()
+            return len(self)
+        if version == self.version:
+            return 0
+
+        keys = [f"scheduler:changes:{v}" for v in range(self.version + 1, version + 1)]
+        changes = cache.get_many(keys)
+        if len(changes) != len(keys):
+            # Часть журнала истекла — надежнее перечитать все
+            self.reload()
+            return len(self)
+
+        ids = set(changes.values())
+        rows = dict(
+            Mailing.objects.filter(
+                id__in=ids,
+                status=Mailing.CREATED,
+                is_active=True,
+                next_run__isnull=False,
+            ).values_list("id", "next_run")
+        )
+        for pk in ids:
+            next_run = rows.get(pk)
+            if next_run is None:
+                self._scheduled.pop(pk, None)
+            elif self._scheduled.get(pk) != next_run:
+                self._scheduled[pk] = next_run
+                heapq.heappush(self._heap, (next_run, pk))
+        self.version = version
+        return len(ids)
+
+    def next_deadline(self):
+        """Время ближайшего запуска или None, если расписание пусто"""
+        while self._heap:
+            next_run, pk = self._heap[0]
+            if self._scheduled.get(pk) == next_run:
+                return next_run
+            heapq.heappop(self._heap)
+        return None
+
+    def pop_due(self, now):
+        """Извлекает id рассылок, время запуска которых наступило"""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            next_run, pk = heapq.heappop(self._heap)
+            if self._scheduled.get(pk) == next_run:
+                del self._scheduled[pk]
+                due.append(pk)
+        return due
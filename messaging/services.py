@@ -0,0 +1,424 @@
+import logging
+import math
+import smtplib
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django import db
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection
+from django.core.mail.backends.smtp import EmailBackend as SMTPBackend
+from django.core.mail.message import sanitize_address
+
+from messaging.mime import PrebuiltPayload
+from messaging.personalization import PersonalizedMessage
+
+logger = logging.getLogger(__name__)
+
+
+class BatchStats:
+    """Статистика отправки одной пачки писем"""
+
+    def __init__(self, number, sent, failed, elapsed):
+        self.number = number
+        self.sent = sent
+        self.failed = failed
+        self.elapsed = elapsed
+
+    @property
+    def throughput(self):
+        """Писем в секунду"""
+        if self.elapsed <= 0:
+            return float(self.sent + self.failed)
+        return (self.sent + self.failed) / self.elapsed
+
+
+class DeliveryReport:
+    """Итог отправки рассылки"""
+
+    def __init__(self):
+        self.sent = 0
+        self.failed = 0
+        self.errors = []
+        self.batches = []
+        self._lock = threading.Lock()
+
+    @property
+    def total(self):
+        return self.sent + self.failed
+
+    def add_batch(self, stats):
+        with self._lock:
+            stats.number = len(self.batches) + 1
+            self.batches.append(stats)
+            self.sent += stats.sent
+            self.failed += stats.failed
+
+    def add_error(self, email, error):
+        with self._lock:
+            self.errors.append((email, error))
+
+
+class RateLimiter:
+    """Ограничитель скорости по ключу (SMTP-хост, домен получателя),
+    общий для всех процессов.
+
+    Время делится на интервалы длиной 1 / rate секунд, в каждом проходит
+    одно письмо: поток занимает интервал floor(now * rate) атомарным
+    cache.add, остальные ждут следующего. Интервалы хранятся в кеше
+    (Redis), поэтому лимит соблюдают все воркеры Celery и их потоки
+    вместе. Дробная скорость соблюдается точно, и на границах интервалов
+    нет всплесков: письма идут не чаще одного за 1 / rate секунд.
+    """
+
+    def __init__(self, rate, prefix="ratelimit"):
+        self.rate = rate
+        self.prefix = prefix
+        # Ключ интервала нужен, только пока интервал не закончился
+        self.timeout = math.ceil(1 / rate) + 1 if rate else None
+
+    def acquire(self, key):
+        """Блокирует поток, пока не наступит свободный интервал"""
+        if not self.rate:
+            return
+        while True:
+            now = time.time()
+            slot = math.floor(now * self.rate)
+            if cache.add(f"{self.prefix}:{key}:{slot}", 1, self.timeout):
+                return
+            time.sleep(max(0, (slot + 1) / self.rate - now))
+
+
+def smtp_result(error=None):
+    """Код и текст ответа SMTP-сервера для успешной отправки или ошибки"""
+    if error is None:
+        return 250, "OK"
+    if isinstance(error, smtplib.SMTPRecipientsRefused) and error.recipients:
+        code, response = next(iter(error.recipients.values()))
+        return code, response.decode(errors="replace")
+    if isinstance(error, smtplib.SMTPResponseException):
+        response = error.smtp_error
+        if isinstance(response, bytes):
+            response = response.decode(errors="replace")
+        return error.smtp_code, response
+    return None, str(error)
+
+
+class BatchSender:
+    """Отправка писем пачками через одно переиспользуемое SMTP-соединение.
+
+    Соединение открывается один раз на всю рассылку, а не на каждого
+    получателя. Ошибка по одному адресу не прерывает пачку.
+
+    Получатели — словари с ключом "email" (например, из values()); остальные
+    ключи доступны в теме и тексте письма как {{ full_name }} и т.п.
+    on_result(recipient, success, smtp_code, response) вызывается
+    для каждого получателя, on_batch(stats) — для каждой пачки.
+
+    При envelope_size > 1 письмо без полей получателя уходит одной
+    SMTP-транзакцией на до envelope_size адресов одного домена в скрытых
+    копиях; ответ сервера на RCPT TO фиксируется по каждому адресу.
+    """
+
+    def __init__(
+        self,
+        connection=None,
+        batch_size=None,
+        from_email=None,
+        throttle=None,
+        envelope_size=1,
+        on_batch=None,
+        on_result=None,
+    ):
+        self.connection = connection or get_connection()
+        self.batch_size = batch_size or settings.MAILING_BATCH_SIZE
+        self.from_email = from_email or settings.DEFAULT_FROM_EMAIL
+        self.throttle = throttle
+        self.envelope_size = envelope_size or 1
+        self.on_batch = on_batch
+        self.on_result = on_result
+        self._payload = None
+
+    def get_payload(self, message):
+        """MIME письма без полей получателя, собранный один раз на рассылку"""
+        payload = self._payload
+        if payload is None or (payload.subject, payload.body) != (
+            message.subject,
+            message.body,
+        ):
+            payload = self._payload = PrebuiltPayload(
+                message.subject, message.body, self.from_email
+            )
+        return payload
+
+    def build_message(self, message, email, recipient):
+        """Письмо получателю; message — PersonalizedMessage.
+
+        Письмо без полей получателя одинаково для всех, поэтому его MIME
+        собирается один раз на рассылку (PrebuiltPayload), а у получателя
+        меняются только To, Date и Message-ID.
+        """
+        if message.is_personalized:
+            subject, body = message.render(recipient)
+            return EmailMessage(
+                subject=subject,
+                body=body,
+                from_email=self.from_email,
+                to=[email],
+                connection=self.connection,
+            )
+        return self.get_payload(message).build(email, self.connection)
+
+    def envelopes(self, message, batch):
+        """Делит пачку на конверты — списки получателей одного письма"""
+        if self.envelope_size <= 1 or message.is_personalized:
+            return [[recipient] for recipient in batch]
+        domains = defaultdict(list)
+        for recipient in batch:
+            domains[recipient["email"].rpartition("@")[2].lower()].append(recipient)
+        return [
+            envelope
+            for recipients in domains.values()
+            for envelope in chunked(recipients, self.envelope_size)
+        ]
+
+    def send(self, subject, body, recipients):
+        """Отправляет письмо всем получателям, возвращает DeliveryReport"""
+        report = DeliveryReport()
+        message = PersonalizedMessage(subject, body)
+        self.connection.open()
+        try:
+            for batch in chunked(recipients, self.batch_size):
+                self.send_batch(message, batch, report)
+        finally:
+            self.connection.close()
+        return report
+
+    def send_batch(self, message, batch, report):
+        """Отправляет пачку получателей; message — PersonalizedMessage"""
+        started = time.perf_counter()
+        sent = failed = 0
+        for envelope in self.envelopes(message, batch):
+            emails = [recipient["email"] for recipient in envelope]
+            if self.throttle:
+                # Лимиты считают SMTP-транзакции, а не адреса
+                self.throttle(emails[0])
+            error = None
+            refused = {}
+            try:
+                if len(envelope) == 1:
+                    self._deliver(self.build_message(message, emails[0], envelope[0]))
+                else:
+                    refused = self._deliver(
+                        self.get_payload(message).build_envelope(
+                            emails, self.connection
+                        )
+                    )
+            except Exception as e:
+                error = e
+            for recipient in envelope:
+                email = recipient["email"]
+                if error is None and email not in refused:
+                    sent += 1
+                    result = (True, 250, "OK")
+                else:
+                    failed += 1
+                    if error is None:
+                        code, response = refused[email]
+                        result = (False, code, response.decode(errors="replace"))
+                    else:
+                        result = (False, *smtp_result(error))
+                    reason = error or f"{result[1]} {result[2]}"
+                    report.add_error(email, str(reason))
+                    logger.warning("Ошибка при отправке клиенту %s: %s", email, reason)
+                if self.on_result:
+                    self.on_result(recipient, *result)
+
+        stats = BatchStats(
+            number=None,
+            sent=sent,
+            failed=failed,
+            elapsed=time.perf_counter() - started,
+        )
+        report.add_batch(stats)
+        logger.info(
+            "Пачка %s: отправлено %s, ошибок %s, %.1f писем/с",
+            stats.number,
+            stats.sent,
+            stats.failed,
+            stats.throughput,
+        )
+        if self.on_batch:
+            self.on_batch(stats)
+
+    def _deliver(self, message):
+        """Отправляет письмо, возвращает отклоненных получателей конверта"""
+        try:
+            return self._send(message)
+        except smtplib.SMTPServerDisconnected:
+            # Сервер закрыл соединение (таймаут, лимит писем на сессию) —
+            # переподключаемся один раз и повторяем
+            self.connection.close()
+            self.connection.open()
+            return self._send(message)
+
+    def _send(self, message):
+        recipients = message.recipients()
+        if len(recipients) == 1 or not isinstance(self.connection, SMTPBackend):
+            # Другие бэкенды не сообщают об отказах по отдельным адресам
+            self.connection.send_messages([message])
+            return {}
+
+        # send_messages отбрасывает ответы на RCPT TO, поэтому конверт
+        # отправляется через smtplib напрямую: sendmail возвращает словарь
+        # отклоненных адресов, а если отклонены все — SMTPRecipientsRefused
+        encoding = message.encoding or settings.DEFAULT_CHARSET
+        addresses = {sanitize_address(email, encoding): email for email in recipients}
+        try:
+            refused = self.connection.connection.sendmail(
+                sanitize_address(message.from_email, encoding),
+                list(addresses),
+                message.message().as_bytes(linesep="\r\n"),
+            )
+        except smtplib.SMTPRecipientsRefused as e:
+            refused = e.recipients
+        return {
+            addresses.get(address, address): reply for address, reply in refused.items()
+        }
+
+
+class ConcurrentDispatcher:
+    """Параллельная отправка рассылки в несколько потоков.
+
+    Каждый поток держит собственное SMTP-соединение и отправляет пачки
+    через BatchSender. Скорость ограничивается отдельно для SMTP-хоста и
+    для каждого домена получателей, общими для всех процессов счетчиками.
+    """
+
+    def __init__(
+        self,
+        workers=None,
+        batch_size=None,
+        host_rate=None,
+        domain_rate=None,
+        connection_factory=None,
+        from_email=None,
+        envelope_size=1,
+        on_batch=None,
+        on_result=None,
+    ):
+        self.workers = workers or settings.MAILING_WORKERS
+        self.batch_size = batch_size or settings.MAILING_BATCH_SIZE
+        self.host_limiter = RateLimiter(
+            settings.MAILING_HOST_RATE if host_rate is None else host_rate,
+            "ratelimit:host",
+        )
+        self.domain_limiter = RateLimiter(
+            settings.MAILING_DOMAIN_RATE if domain_rate is None else domain_rate,
+            "ratelimit:domain",
+        )
+        self.connection_factory = connection_factory or get_connection
+        self.from_email = from_email
+        self.envelope_size = envelope_size
+        self.on_batch = on_batch
+        self.on_result = on_result
+        self._local = threading.local()
+        self._senders = []
+        self._senders_lock = threading.Lock()
+
+    def send(self, subject, body, recipients):
+        """Отправляет письмо всем получателям, возвращает DeliveryReport"""
+        report = DeliveryReport()
+        # Шаблоны темы и текста разбираются один раз на всю рассылку
+        message = PersonalizedMessage(subject, body)
+        # Ограничиваем число пачек в очереди, чтобы не держать в памяти
+        # весь список получателей
+        slots = threading.BoundedSemaphore(self.workers * 2)
+
+        def run(batch):
+            # id получателя -> успех, для уже сообщенных результатов пачки
+            self._local.reported = reported = {}
+            try:
+                self._get_sender().send_batch(message, batch, report)
+            except Exception as e:
+                # Соединение не открылось или пачка прервалась на середине —
+                # неуспешны только получатели, результат которых не сообщен,
+                # иначе у отправленных появилась бы вторая запись доставки
+                logger.exception("Ошибка при отправке пачки")
+                for recipient in batch:
+                    if id(recipient) in reported:
+                        continue
+                    report.add_error(recipient["email"], str(e))
+                    if self.on_result:
+                        self.on_result(recipient, False, *smtp_result(e))
+                sent = sum(reported.values())
+                stats = BatchStats(None, sent, len(batch) - sent, 0)
+                report.add_batch(stats)
+                if self.on_batch:
+                    self.on_batch(stats)
+            finally:
+                # Колбэки могли открыть соединение с БД в этом потоке
+                db.connections.close_all()
+                slots.release()
+
+        try:
+            with ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="mailing"
+            ) as executor:
+                for batch in chunked(recipients, self.batch_size):
+                    slots.acquire()
+                    executor.submit(run, batch)
+        finally:
+            for sender in self._senders:
+                sender.connection.close()
+            self._senders = []
+        return report
+
+    def _get_sender(self):
+        sender = getattr(self._local, "sender", None)
+        if sender is None:
+            connection = self.connection_factory()
+            connection.open()
+            sender = BatchSender(
+                connection=connection,
+                batch_size=self.batch_size,
+                from_email=self.from_email,
+                throttle=self._throttle_for(connection),
+                envelope_size=self.envelope_size,
+                on_batch=self.on_batch,
+                on_result=self._report_result,
+            )
+            self._local.sender = sender
+            with self._senders_lock:
+                self._senders.append(sender)
+        return sender
+
+    def _report_result(self, recipient, success, smtp_code, response):
+        # Отмечаем до колбэка: если упадет он, получатель уже учтен
+        self._local.reported[id(recipient)] = success
+        if self.on_result:
+            self.on_result(recipient, success, smtp_code, response)
+
+    def _throttle_for(self, connection):
+        host = getattr(connection, "host", None) or "local"
+
+        def throttle(email):
+            self.host_limiter.acquire(host)
+            self.domain_limiter.acquire(email.rpartition("@")[2].lower())
+
+        return throttle
+
+
+def chunked(iterable, size):
+    """Разбивает итерируемый объект на списки длиной не более size"""
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
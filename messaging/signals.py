@@ -1,18 +1,31 @@
-from django.contrib.auth.models import Permission, Group, User
-from django.contrib.contenttypes.models import ContentType
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
 
+from messaging.caching import bump_generation
+from messaging.models import Client, Mailing, Message
+from messaging.scheduler import notify_mailing_changed
 
-manager_group, created = Group.objects.get_or_create(name="Managers")
 
+@receiver(post_save, sender=Mailing)
+@receiver(post_delete, sender=Mailing)
+def mailing_changed(sender, instance, **kwargs):
+    """Сообщает демону run_scheduler об изменении расписания рассылки"""
+    notify_mailing_changed(instance.pk)
+    bump_generation(instance.owner_id)
 
-content_type = ContentType.objects.get_for_model(User)
-view_all = Permission.objects.get(codename="can_view_all")
-is_manager = Permission.objects.get(codename="is_manager")
 
+@receiver(post_save, sender=Client)
+@receiver(post_delete, sender=Client)
+@receiver(post_save, sender=Message)
+@receiver(post_delete, sender=Message)
+def owner_data_changed(sender, instance, **kwargs):
+    """Устаревают закешированные страницы и счетчики владельца"""
+    bump_generation(instance.owner_id)
 
-manager_group.permissions.add(view_all, is_manager)
 
-# Assign user to group
-user = User.objects.get(email="ekaterina.kuz@gmail.com")
-user.groups.add(manager_group)
-user.save()
\ No newline at end of file
+@receiver(m2m_changed, sender=Mailing.clients.through)
+def mailing_clients_changed(sender, instance, action, **kwargs):
+    # instance — рассылка или клиент, в зависимости от стороны связи;
+    # у обоих есть владелец
+    if action.startswith("post_"):
+        bump_generation(instance.owner_id)
@@ -0,0 +1,132 @@
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from messaging.caching import get_generation
+from messaging.models import Attempt, DailyStats, Delivery, Mailing
+
+STATS_FIELDS = (
+    "successful_attempts",
+    "failed_attempts",
+    "messages_sent",
+    "messages_failed",
+)
+
+DASHBOARD_TIMEOUT = 60 * 60
+
+
+def dashboard_key(owner_id=None):
+    return f"dashboard:{owner_id or 'all'}:{get_generation(owner_id)}"
+
+
+def get_dashboard_stats(user):
+    """Счетчики главной страницы: для пользователя — по его рассылкам.
+
+    Считаются одним агрегирующим запросом и кешируются до ближайшего
+    изменения рассылок или клиентов владельца: ключ содержит поколение
+    данных (см. messaging/caching.py и messaging/signals.py).
+    """
+    owner_id = user.pk if user.is_authenticated else None
+    key = dashboard_key(owner_id)
+    stats = cache.get(key)
+    if stats is None:
+        mailings = Mailing.objects.all()
+        if owner_id:
+            mailings = mailings.filter(owner_id=owner_id)
+        stats = mailings.aggregate(
+            total_mailings=Count("id", distinct=True),
+            active_mailings=Count(
+                "id", distinct=True, filter=Q(status=Mailing.STARTED)
+            ),
+            unique_clients=Count("clients", distinct=True),
+        )
+        cache.set(key, stats, DASHBOARD_TIMEOUT)
+    return stats
+
+
+def record_attempt(attempt, sent=0, failed=0):
+    """Добавляет итог попытки в дневные счетчики владельца рассылки"""
+    owner_id = attempt.mailing.owner_id
+    if owner_id is None:
+        return
+    increments = {
+        "successful_attempts": int(attempt.status == Attempt.SUCCESS),
+        "failed_attempts": int(attempt.status == Attempt.FAILURE),
+        "messages_sent": sent,
+        "messages_failed": failed,
+    }
+    updates = {field: F(field) + value for field, value in increments.items() if value}
+    if not updates:
+        return
+
+    day = timezone.localdate(attempt.attempt_time)
+    rows = DailyStats.objects.filter(owner_id=owner_id, date=day)
+    if rows.update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            DailyStats.objects.create(owner_id=owner_id, date=day, **increments)
+    except IntegrityError:
+        # Строку за этот день успел создать параллельный процесс
+        rows.update(**updates)
+
+
+def get_user_stats(user, days=30):
+    """Итоги и разбивка по дням из DailyStats, без обращения к Attempt"""
+    rows = DailyStats.objects.filter(owner=user)
+    totals = rows.aggregate(**{field: Sum(field) for field in STATS_FIELDS})
+    return {
+        "totals": {field: totals[field] or 0 for field in STATS_FIELDS},
+        "days": list(rows.order_by("-date")[:days]),
+    }
+
+
+def rebuild_daily_stats():
+    """Полностью пересчитывает DailyStats по истории попыток и доставок"""
+    counters = {}
+
+    def row(owner_id, day):
+        return counters.setdefault((owner_id, day), dict.fromkeys(STATS_FIELDS, 0))
+
+    attempts = (
+        Attempt.objects.filter(mailing__owner__isnull=False)
+        .annotate(day=TruncDate("attempt_time"))
+        .values("mailing__owner", "day")
+        .annotate(
+            successful=Count("id", filter=Q(status=Attempt.SUCCESS)),
+            failed=Count("id", filter=Q(status=Attempt.FAILURE)),
+        )
+        .order_by()
+    )
+    for item in attempts:
+        counters_row = row(item["mailing__owner"], item["day"])
+        counters_row["successful_attempts"] = item["successful"]
+        counters_row["failed_attempts"] = item["failed"]
+
+    deliveries = (
+        Delivery.objects.filter(mailing__owner__isnull=False)
+        .annotate(day=TruncDate("attempt__attempt_time"))
+        .values("mailing__owner", "day")
+        .annotate(
+            sent=Count("id", filter=Q(status=Delivery.SUCCESS)),
+            failed=Count("id", filter=Q(status=Delivery.FAILURE)),
+        )
+        .order_by()
+    )
+    for item in deliveries:
+        counters_row = row(item["mailing__owner"], item["day"])
+        counters_row["messages_sent"] = item["sent"]
+        counters_row["messages_failed"] = item["failed"]
+
+    with transaction.atomic():
+        DailyStats.objects.all().delete()
+        DailyStats.objects.bulk_create(
+            (
+                DailyStats(owner_id=owner_id, date=day, **values)
+                for (owner_id, day), values in counters.items()
+            ),
+            batch_size=1000,
+        )
+    return len(counters)
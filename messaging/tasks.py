@@ -1,32 +1,135 @@
-from celery import shared_task
-from .models import Mailing
-from django.core.mail import send_mail
+import logging
+import threading
+
+from celery import chord, shared_task
+from django.conf import settings
+
+from messaging.ledger import DeliveryLedger
+from messaging.models import Attempt, Mailing
+from messaging.progress import add_progress, finish_progress, start_progress
+from messaging.scheduler import reschedule
+from messaging.services import ConcurrentDispatcher, smtp_result
+
+logger = logging.getLogger(__name__)
+
+
+def recipient_ranges(mailing, size):
+    """Границы (первый id, последний id) частей по size получателей.
+
+    id читаются потоково, в памяти держатся только границы частей,
+    поэтому разбиение рассылки на миллион адресов не требует списка
+    всех id. Возвращает границы и общее число получателей.
+    """
+    ranges = []
+    total = 0
+    first = last = None
+    client_ids = mailing.clients.order_by("id").values_list("id", flat=True)
+    for client_id in client_ids.iterator(
+        chunk_size=settings.MAILING_ITERATOR_CHUNK_SIZE
+    ):
+        if first is None:
+            first = client_id
+        last = client_id
+        total += 1
+        if total % size == 0:
+            ranges.append((first, last))
+            first = None
+    if first is not None:
+        ranges.append((first, last))
+    return ranges, total
 
 
 @shared_task
-def send_mailing_async(mailing_id):
+def send_mailing(mailing_id):
+    """Разбивает получателей рассылки на части и отправляет их параллельно.
+
+    Каждая часть — отдельная задача send_mailing_chunk, все части
+    объединены в chord, по завершении которого вызывается finish_mailing.
+    """
     try:
         mailing = Mailing.objects.get(id=mailing_id)
     except Mailing.DoesNotExist:
         return
 
-    messages = mailing.messages.all()
-    recipients = mailing.recipients.all()
-
-    def send_message(email, text):
-        send_mail(
-            subject="Новое сообщение",
-            message=text,
-            from_email="ekaterina.kuz@gmail.com",
-            recipient_list=[email],
-            fail_silently=False,
-        )
-
-    for message in messages:
-        for recipient in recipients:
-            email = recipient.email
-            if email:  # Проверка наличия email
-                send_message(email, message.text)
-
-    mailing.status = Mailing.Status.COMPLETED
-    mailing.save()
\ No newline at end of file
+    attempt = Attempt.objects.create(mailing=mailing, status=Attempt.PENDING)
+    ranges, total = recipient_ranges(mailing, settings.MAILING_CHUNK_SIZE)
+    start_progress(mailing_id, mailing.owner_id, total)
+    if not ranges:
+        finish_mailing([], mailing_id, attempt.id)
+        return
+
+    chord(
+        send_mailing_chunk.s(mailing_id, attempt.id, first, last)
+        for first, last in ranges
+    )(finish_mailing.s(mailing_id, attempt.id))
+
+
+@shared_task
+def send_mailing_chunk(mailing_id, attempt_id, first_id, last_id):
+    """Отправляет рассылку получателям с id от first_id до last_id.
+
+    Часть отправляется через ConcurrentDispatcher: MAILING_WORKERS потоков
+    с лимитами скорости, общими для всех воркеров Celery.
+
+    Ошибка, прервавшая отправку части (SMTP недоступен, битый шаблон
+    письма), не роняет задачу: оставшиеся получатели записываются как
+    неуспешные, чтобы chord дошел до finish_mailing и рассылка не
+    осталась в статусе "Запущена".
+    """
+    attempt = Attempt.objects.select_related("mailing__message").get(id=attempt_id)
+    mailing = attempt.mailing
+    recipients = {"sent": 0, "failed": 0}
+    progress = {"sent": 0, "failed": 0}
+    reported = set()
+    # Колбэки вызываются из потоков ConcurrentDispatcher
+    lock = threading.Lock()
+
+    def on_batch(stats):
+        add_progress(mailing_id, stats.sent, stats.failed)
+        with lock:
+            progress["sent"] += stats.sent
+            progress["failed"] += stats.failed
+
+    with DeliveryLedger(attempt) as ledger:
+
+        def on_result(recipient, success, smtp_code, response):
+            with lock:
+                reported.add(recipient["id"])
+                recipients["sent" if success else "failed"] += 1
+            ledger.record(recipient, success, smtp_code, response)
+
+        try:
+            ConcurrentDispatcher(
+                envelope_size=mailing.envelope_size,
+                on_batch=on_batch,
+                on_result=on_result,
+            ).send(
+                subject=mailing.message.subject,
+                body=mailing.message.body,
+                recipients=mailing.iter_recipients(id__range=(first_id, last_id)),
+            )
+        except Exception as e:
+            logger.exception("Ошибка при отправке части рассылки %s", mailing_id)
+            for recipient in mailing.iter_recipients(id__range=(first_id, last_id)):
+                if recipient["id"] not in reported:
+                    on_result(recipient, False, *smtp_result(e))
+            add_progress(
+                mailing_id,
+                recipients["sent"] - progress["sent"],
+                recipients["failed"] - progress["failed"],
+            )
+    return recipients
+
+
+@shared_task
+def finish_mailing(results, mailing_id, attempt_id):
+    """Callback chord: закрывает попытку и планирует следующий запуск рассылки"""
+    sent = sum(result["sent"] for result in results)
+    failed = sum(result["failed"] for result in results)
+    Attempt.objects.select_related("mailing").get(id=attempt_id).finish(sent, failed)
+    try:
+        reschedule(Mailing.objects.get(id=mailing_id))
+    except Mailing.DoesNotExist:
+        pass
+    finish_progress(mailing_id)
+    return {"sent": sent, "failed": failed}
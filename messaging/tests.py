@@ -1,3 +1,1430 @@
-from django.test import TestCase
+import base64
+import importlib
+import io
+import json
+import os
+import multiprocessing
+import smtplib
+import socket
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from datetime import datetime, timedelta, timezone as dt_timezone
 
-# Create your tests here.
\ No newline at end of file
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, connections, transaction
+from django.http import Http404
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from config import celery_app
+from config.cache import TieredCache
+from config.metrics import registry
+from messaging.caching import bump_generation, get_generation
+from messaging.forms import MailingForm, MessageForm
+from messaging.imports import ClientImporter, read_csv, read_xlsx
+from messaging.ledger import DeliveryLedger
+from messaging.models import (
+    Attempt,
+    Client,
+    DailyStats,
+    Delivery,
+    Mailing,
+    Message,
+)
+from messaging.mime import PrebuiltPayload
+from messaging.mixins import paginate_keyset
+from messaging.personalization import PersonalizedMessage, engine
+from messaging.progress import add_progress, get_progress, start_progress
+from messaging.scheduler import (
+    MailingTimerQueue,
+    claim_due_mailings,
+    due_mailings,
+    next_run_after,
+    reschedule,
+)
+from messaging.services import BatchSender, ConcurrentDispatcher, RateLimiter
+from messaging.stats import rebuild_daily_stats
+from messaging.tasks import finish_mailing, send_mailing
+from messaging.views import AttemptListView, MailingDetailView
+from users.models import User
+
+try:
+    from aiosmtpd.controller import Controller
+except ImportError:
+    Controller = None
+
+try:
+    import openpyxl
+except ImportError:
+    openpyxl = None
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+class RecordingHandler:
+    def __init__(self):
+        self.envelopes = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.envelopes.append(envelope)
+        return "250 OK"
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def eager_celery(test):
+    """Выполняет задачи Celery, включая chord, синхронно до конца теста"""
+    test.addCleanup(
+        celery_app.conf.update,
+        task_always_eager=celery_app.conf.task_always_eager,
+        result_backend=celery_app.conf.result_backend,
+    )
+    celery_app.conf.update(task_always_eager=True, result_backend="cache+memory://")
+
+
+class RateLimiterTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.now = 1000.0
+        self.sleep = mock.Mock(side_effect=self.advance)
+        patcher = mock.patch.multiple(
+            "messaging.services.time", time=lambda: self.now, sleep=self.sleep
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def advance(self, seconds):
+        self.now += seconds
+
+    def test_limit_is_shared_between_limiters(self):
+        # Два экземпляра — как два воркера Celery с общим Redis
+        first, second = RateLimiter(2), RateLimiter(2)
+        first.acquire("smtp.example.com")
+        second.acquire("smtp.example.com")
+        self.assertEqual(self.now, 1000.5)
+        first.acquire("smtp.example.com")
+        self.assertEqual(self.now, 1001.0)
+
+    def test_keys_and_slow_rates(self):
+        limiter = RateLimiter(0.1)
+        limiter.acquire("a.example")
+        limiter.acquire("b.example")
+        self.sleep.assert_not_called()
+        # Меньше письма в секунду: одно письмо на интервал в 10 секунд
+        limiter.acquire("a.example")
+        self.assertAlmostEqual(self.now, 1010.0)
+
+    def test_fractional_rate_without_bursts(self):
+        limiter = RateLimiter(1.9)
+        sent_at = []
+        for _ in range(20):
+            limiter.acquire("smtp.example.com")
+            sent_at.append(self.now)
+
+        # 1.9 письма в секунду, а не 1, и без пачек на границе секунды
+        self.assertAlmostEqual(sent_at[-1] - sent_at[0], 19 / 1.9, places=6)
+        intervals = [b - a for a, b in zip(sent_at, sent_at[1:])]
+        self.assertGreaterEqual(min(intervals), 1 / 1.9 - 1e-6)
+
+
+class ConcurrentDispatcherTest(SimpleTestCase):
+    def test_sends_to_every_recipient(self):
+        emails = [f"client{i}@example.com" for i in range(25)]
+        report = ConcurrentDispatcher(
+            workers=3, batch_size=4, from_email="noreply@example.com"
+        ).send("Тема", "Текст", [{"email": email} for email in emails])
+
+        self.assertEqual(report.sent, 25)
+        self.assertEqual(report.failed, 0)
+        self.assertEqual(len(report.batches), 7)
+        self.assertCountEqual([m.to[0] for m in mail.outbox], emails)
+
+    def test_batch_interrupted_midway_reports_each_recipient_once(self):
+        emails = [f"client{i}@example.com" for i in range(4)]
+        results = []
+
+        def on_result(recipient, success, smtp_code, response):
+            results.append((recipient["email"], success))
+            if len(results) == 2:
+                # Например, журнал доставок не смог записать пачку
+                raise RuntimeError("Журнал недоступен")
+
+        with self.assertLogs("messaging.services", "ERROR"):
+            report = ConcurrentDispatcher(
+                workers=1,
+                batch_size=4,
+                from_email="noreply@example.com",
+                on_result=on_result,
+            ).send("Тема", "Текст", [{"email": email} for email in emails])
+
+        self.assertEqual(
+            results,
+            [
+                (emails[0], True),
+                (emails[1], True),
+                (emails[2], False),
+                (emails[3], False),
+            ],
+        )
+        self.assertEqual((report.sent, report.failed), (2, 2))
+
+    @unittest.skipIf(Controller is None, "aiosmtpd не установлен")
+    def test_local_smtp_server(self):
+        handler = RecordingHandler()
+        controller = Controller(handler, hostname="127.0.0.1", port=free_port())
+        controller.start()
+        self.addCleanup(controller.stop)
+
+        def connection_factory():
+            return get_connection(
+                "django.core.mail.backends.smtp.EmailBackend",
+                host=controller.hostname,
+                port=controller.port,
+                username="",
+                password="",
+                use_tls=False,
+                use_ssl=False,
+            )
+
+        emails = [f"client{i}@example.com" for i in range(10)]
+        report = ConcurrentDispatcher(
+            workers=2,
+            batch_size=3,
+            domain_rate=100,
+            connection_factory=connection_factory,
+            from_email="noreply@example.com",
+        ).send("Тема", "Текст", [{"email": email} for email in emails])
+
+        self.assertEqual(report.sent, 10)
+        self.assertCountEqual(
+            [envelope.rcpt_tos[0] for envelope in handler.envelopes], emails
+        )
+
+
+class PersonalizedMessageTest(SimpleTestCase):
+    def test_fields_are_substituted(self):
+        message = PersonalizedMessage(
+            "Для {{ full_name }}", "Здравствуйте, {{ full_name }} <{{ email }}>"
+        )
+        self.assertEqual(
+            message.render({"email": "a@example.com", "full_name": "Иван & Ко"}),
+            ("Для Иван & Ко", "Здравствуйте, Иван & Ко <a@example.com>"),
+        )
+
+    def test_subject_stays_single_line(self):
+        message = PersonalizedMessage("Для {{ full_name }}", "Текст")
+        self.assertEqual(
+            message.render({"full_name": "Иван\nПетров"}), ("Для Иван Петров", "Текст")
+        )
+
+    def test_plain_text_is_not_rendered(self):
+        message = PersonalizedMessage("Тема", "Текст")
+        self.assertFalse(message.is_personalized)
+        with mock.patch("messaging.personalization.Context") as context:
+            self.assertEqual(
+                message.render({"email": "a@example.com"}), ("Тема", "Текст")
+            )
+        context.assert_not_called()
+
+    def test_templates_are_compiled_once_per_send(self):
+        recipients = [
+            {"email": f"client{i}@example.com", "full_name": f"Клиент {i}"}
+            for i in range(10)
+        ]
+        with mock.patch.object(
+            engine, "from_string", wraps=engine.from_string
+        ) as from_string:
+            ConcurrentDispatcher(
+                workers=2, batch_size=3, from_email="noreply@example.com"
+            ).send("{{ full_name }}", "Здравствуйте, {{ full_name }}!", recipients)
+
+        self.assertEqual(from_string.call_count, 2)
+        self.assertCountEqual(
+            [(m.to[0], m.subject, m.body) for m in mail.outbox],
+            [
+                (r["email"], r["full_name"], f"Здравствуйте, {r['full_name']}!")
+                for r in recipients
+            ],
+        )
+
+    def test_form_rejects_broken_template(self):
+        form = MessageForm(data={"subject": "Тема", "body": "{% if full_name %}"})
+        self.assertFalse(form.is_valid())
+        self.assertIn("body", form.errors)
+
+
+class PrebuiltPayloadTest(SimpleTestCase):
+    def setUp(self):
+        self.payload = PrebuiltPayload(
+            "Тема рассылки", "Текст письма", "noreply@example.com"
+        )
+        self.emails = ["first@example.com", "second@example.com"]
+
+    def send(self, connection):
+        sender = BatchSender(connection=connection, from_email="noreply@example.com")
+        return sender.send(
+            "Тема рассылки", "Текст письма", [{"email": e} for e in self.emails]
+        )
+
+    def test_matches_regular_message(self):
+        regular = EmailMessage(
+            "Тема рассылки", "Текст письма", "noreply@example.com", ["a@example.com"]
+        ).message()
+        prebuilt = self.payload.build("a@example.com").message()
+        for name in (
+            "Subject",
+            "From",
+            "To",
+            "Content-Type",
+            "Content-Transfer-Encoding",
+        ):
+            self.assertEqual(prebuilt[name], regular[name])
+        self.assertEqual(prebuilt.get_payload(), regular.get_payload())
+
+    def test_recipient_headers_do_not_leak(self):
+        first = self.payload.message(["first@example.com"])
+        second = self.payload.message(["second@example.com"])
+        self.assertEqual(first.get_all("To"), ["first@example.com"])
+        self.assertEqual(second.get_all("To"), ["second@example.com"])
+        self.assertNotEqual(first["Message-ID"], second["Message-ID"])
+        self.assertIsNone(self.payload.mime["To"])
+
+    def test_mime_is_built_once_per_mailing(self):
+        with mock.patch.object(
+            EmailMessage, "message", autospec=True, side_effect=EmailMessage.message
+        ) as build:
+            report = self.send(get_connection())
+        self.assertEqual(report.sent, 2)
+        self.assertEqual(build.call_count, 1)
+        self.assertEqual([m.to for m in mail.outbox], [[e] for e in self.emails])
+
+    def test_file_backend(self):
+        with tempfile.TemporaryDirectory() as path:
+            self.send(
+                get_connection(
+                    "django.core.mail.backends.filebased.EmailBackend", file_path=path
+                )
+            )
+            content = "".join(
+                open(f"{path}/{name}").read() for name in sorted(os.listdir(path))
+            )
+        for email in self.emails:
+            self.assertIn(f"To: {email}", content)
+
+    def test_smtp_backend(self):
+        connection = get_connection(
+            "django.core.mail.backends.smtp.EmailBackend", use_tls=False, use_ssl=False
+        )
+        # Открытое соединение: бэкенд не подключается к серверу
+        smtp = connection.connection = mock.Mock()
+        self.send(connection)
+        sent = smtp.sendmail.call_args_list
+        self.assertEqual([call.args[1] for call in sent], [[e] for e in self.emails])
+        self.assertIn(b"To: second@example.com\r\n", sent[1].args[2])
+
+
+class EnvelopeBatchingTest(TestCase):
+    emails = [
+        "a1@a.example",
+        "b1@b.example",
+        "a2@a.example",
+        "a3@A.example",
+        "b2@b.example",
+    ]
+
+    def send(self, connection, subject="Тема", body="Текст", envelope_size=2):
+        results = []
+        BatchSender(
+            connection=connection,
+            from_email="noreply@example.com",
+            envelope_size=envelope_size,
+            on_result=lambda recipient, *result: results.append(
+                (recipient["email"], *result)
+            ),
+        ).send(subject, body, [{"email": e, "full_name": e} for e in self.emails])
+        return results
+
+    def smtp_connection(self, sendmail):
+        connection = get_connection(
+            "django.core.mail.backends.smtp.EmailBackend", use_tls=False, use_ssl=False
+        )
+        connection.connection = mock.Mock(**{"sendmail.side_effect": sendmail})
+        return connection
+
+    def test_recipients_are_grouped_by_domain(self):
+        results = self.send(get_connection())
+
+        self.assertEqual(
+            [m.recipients() for m in mail.outbox],
+            [["a1@a.example", "a2@a.example"], ["a3@A.example"], self.emails[1::3]],
+        )
+        mime = mail.outbox[0].message()
+        self.assertEqual(mime["To"], "undisclosed-recipients:;")
+        self.assertIsNone(mime["Bcc"])
+        self.assertEqual(len(results), 5)
+        self.assertTrue(all(success for _, success, _, _ in results))
+
+    def test_personalized_messages_are_sent_one_by_one(self):
+        self.send(get_connection(), body="Здравствуйте, {{ full_name }}")
+        self.assertEqual([m.to for m in mail.outbox], [[e] for e in self.emails])
+
+    def test_rcpt_refusals_are_recorded_per_recipient(self):
+        def sendmail(from_email, recipients, message):
+            if "a2@a.example" in recipients:
+                return {"a2@a.example": (550, b"No such user")}
+            if "b1@b.example" in recipients:
+                raise smtplib.SMTPRecipientsRefused(
+                    {address: (450, b"Try later") for address in recipients}
+                )
+            return {}
+
+        connection = self.smtp_connection(sendmail)
+        smtp = connection.connection
+        with self.assertLogs("messaging.services", "WARNING"):
+            results = self.send(connection)
+
+        self.assertEqual(smtp.sendmail.call_count, 3)
+        self.assertCountEqual(
+            results,
+            [
+                ("a1@a.example", True, 250, "OK"),
+                ("a2@a.example", False, 550, "No such user"),
+                ("a3@A.example", True, 250, "OK"),
+                ("b1@b.example", False, 450, "Try later"),
+                ("b2@b.example", False, 450, "Try later"),
+            ],
+        )
+
+    def test_mailing_option(self):
+        owner = User.objects.create(email="owner@example.com")
+        message = Message.objects.create(subject="Тема", body="Текст", owner=owner)
+        mailing = Mailing.objects.create(
+            start_time=timezone.now(), message=message, owner=owner, envelope_size=10
+        )
+        mailing.clients.set(
+            Client.objects.create(email=email, full_name=email, owner=owner)
+            for email in self.emails
+        )
+
+        mailing.status = Mailing.STARTED
+        mailing.save()
+        eager_celery(self)
+        send_mailing.delay(mailing.pk)
+
+        self.assertEqual(Attempt.objects.get(mailing=mailing).status, Attempt.SUCCESS)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(
+            Delivery.objects.filter(mailing=mailing, status=Delivery.SUCCESS).count(), 5
+        )
+
+        message.body = "Здравствуйте, {{ full_name }}"
+        message.save()
+        form = MailingForm(
+            data={
+                "start_time": "2030-01-01T10:00",
+                "frequency": Mailing.DAILY,
+                "clients": [c.pk for c in Client.objects.all()],
+                "message": message.pk,
+                "status": Mailing.CREATED,
+                "envelope_size": 10,
+            },
+            user=owner,
+        )
+        self.assertFalse(form.is_valid())
+        self.assertIn("envelope_size", form.errors)
+
+
+class SendMailingTaskTest(TestCase):
+    def setUp(self):
+        eager_celery(self)
+        owner = User.objects.create(email="owner@example.com")
+        message = Message.objects.create(subject="Тема", body="Текст", owner=owner)
+        self.mailing = Mailing.objects.create(
+            start_time=timezone.now(),
+            end_time=timezone.now() + timedelta(days=1),
+            message=message,
+            owner=owner,
+            status=Mailing.STARTED,
+        )
+        self.mailing.clients.set(
+            Client.objects.create(
+                email=f"client{i}@example.com", full_name=f"Клиент {i}", owner=owner
+            )
+            for i in range(5)
+        )
+
+    @override_settings(MAILING_CHUNK_SIZE=2)
+    def test_chunks_are_sent_and_mailing_completed(self):
+        send_mailing.delay(self.mailing.id)
+
+        self.mailing.refresh_from_db()
+        self.assertEqual(self.mailing.status, Mailing.COMPLETED)
+        self.assertEqual(len(mail.outbox), 5)
+
+        attempt = Attempt.objects.get(mailing=self.mailing)
+        self.assertEqual(attempt.status, Attempt.SUCCESS)
+        self.assertEqual(
+            attempt.deliveries.filter(status=Delivery.SUCCESS, smtp_code=250).count(),
+            5,
+        )
+
+    @override_settings(
+        MAILING_CHUNK_SIZE=2, MAILING_HOST_RATE=100, MAILING_DOMAIN_RATE=50
+    )
+    def test_chunks_are_rate_limited(self):
+        with mock.patch.object(RateLimiter, "acquire", autospec=True) as acquire:
+            send_mailing.delay(self.mailing.id)
+
+        calls = [(call.args[0].prefix, call.args[1]) for call in acquire.call_args_list]
+        self.assertEqual(calls.count(("ratelimit:host", "local")), 5)
+        self.assertEqual(calls.count(("ratelimit:domain", "example.com")), 5)
+
+    @override_settings(MAILING_CHUNK_SIZE=2)
+    def test_daily_stats_are_updated_incrementally(self):
+        send_mailing.delay(self.mailing.id)
+        fields = ("successful_attempts", "failed_attempts", "messages_sent")
+        incremental = list(DailyStats.objects.values_list(*fields))
+        self.assertEqual(incremental, [(1, 0, 5)])
+
+        rebuild_daily_stats()
+        self.assertEqual(list(DailyStats.objects.values_list(*fields)), incremental)
+
+    @override_settings(MAILING_LEDGER_BUFFER=2)
+    def test_ledger_is_written_in_bulk(self):
+        attempt = Attempt.objects.create(mailing=self.mailing, status=Attempt.PENDING)
+        clients = list(self.mailing.clients.values("id", "email"))
+
+        # 5 записей при буфере 2 — три INSERT вместо пяти
+        with self.assertNumQueries(3):
+            with DeliveryLedger(attempt) as ledger:
+                for recipient in clients:
+                    ledger.record(recipient, False, 550, "Mailbox unavailable")
+
+        self.assertEqual(attempt.deliveries.filter(smtp_code=550).count(), 5)
+
+    def assert_mailing_failed(self, sent, failed):
+        self.mailing.refresh_from_db()
+        self.assertEqual(self.mailing.status, Mailing.COMPLETED)
+        attempt = Attempt.objects.get(mailing=self.mailing)
+        self.assertEqual(
+            attempt.server_response, f"Отправлено: {sent}, ошибок: {failed}"
+        )
+        self.assertEqual(attempt.deliveries.count(), 5)
+        progress = get_progress(self.mailing.id)
+        self.assertEqual((progress["sent"], progress["failed"]), (sent, failed))
+        self.assertTrue(progress["finished"])
+
+    @override_settings(MAILING_CHUNK_SIZE=2)
+    def test_failed_chunks_still_finish_mailing(self):
+        # Тело, сохраненное до проверки шаблонов в форме
+        Message.objects.filter(pk=self.mailing.message_id).update(body="{% if %}")
+        with self.assertLogs("messaging.tasks", "ERROR"):
+            send_mailing.delay(self.mailing.id)
+
+        self.assert_mailing_failed(sent=0, failed=5)
+        self.assertEqual(Attempt.objects.get().status, Attempt.FAILURE)
+
+    @override_settings(MAILING_CHUNK_SIZE=5, MAILING_BATCH_SIZE=2, MAILING_WORKERS=1)
+    def test_chunk_interrupted_midway(self):
+        send_batch = BatchSender.send_batch
+        batches = []
+
+        def fail_after_first_batch(sender, *args):
+            batches.append(args)
+            if len(batches) > 1:
+                raise smtplib.SMTPServerDisconnected("Connection lost")
+            return send_batch(sender, *args)
+
+        with mock.patch.object(BatchSender, "send_batch", fail_after_first_batch):
+            with self.assertLogs("messaging.services", "ERROR"):
+                send_mailing.delay(self.mailing.id)
+
+        self.assert_mailing_failed(sent=2, failed=3)
+
+
+class MailingProgressViewTest(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create(email="owner@example.com")
+        self.client.force_login(self.owner)
+
+    def test_progress_is_read_from_cache(self):
+        start_progress(42, self.owner.pk, total=10)
+        add_progress(42, sent=3, failed=1)
+
+        # Только сессия и пользователь, сама рассылка в БД не читается
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("messaging:mailing_progress", args=[42]))
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data["total"], data["sent"], data["failed"]), (10, 3, 1))
+        self.assertFalse(data["finished"])
+
+    def test_progress_of_foreign_mailing_is_hidden(self):
+        start_progress(43, self.owner.pk + 1, total=10)
+        response = self.client.get(reverse("messaging:mailing_progress", args=[43]))
+        self.assertEqual(response.status_code, 404)
+
+
+class SchedulerTest(TestCase):
+    def setUp(self):
+        owner = User.objects.create(email="owner@example.com")
+        self.message = Message.objects.create(subject="Тема", body="Текст", owner=owner)
+        self.start = datetime(2025, 1, 31, 10, 0, tzinfo=dt_timezone.utc)
+
+    def create_mailing(self, **kwargs):
+        return Mailing.objects.create(
+            start_time=self.start, message=self.message, **kwargs
+        )
+
+    def test_next_run_follows_frequency(self):
+        after = self.start + timedelta(days=40)
+        weekly = Mailing(start_time=self.start, frequency=Mailing.WEEKLY)
+        monthly = Mailing(start_time=self.start, frequency=Mailing.MONTHLY)
+
+        self.assertEqual(next_run_after(weekly, after), self.start + timedelta(weeks=6))
+        self.assertEqual(
+            next_run_after(monthly, after),
+            datetime(2025, 3, 31, 10, 0, tzinfo=dt_timezone.utc),
+        )
+
+    def test_due_mailings_use_next_run(self):
+        mailing = self.create_mailing()
+        self.create_mailing(is_active=False)
+
+        self.assertEqual(mailing.next_run, self.start)
+        self.assertQuerySetEqual(due_mailings(self.start), [mailing])
+        self.assertQuerySetEqual(due_mailings(self.start - timedelta(seconds=1)), [])
+
+    def test_reschedule_requeues_until_end_time(self):
+        mailing = self.create_mailing(
+            frequency=Mailing.DAILY, end_time=self.start + timedelta(days=1, hours=1)
+        )
+
+        self.assertEqual(claim_due_mailings(self.start), [mailing.id])
+        reschedule(mailing, now=self.start)
+        self.assertEqual(mailing.status, Mailing.CREATED)
+        self.assertEqual(mailing.next_run, self.start + timedelta(days=1))
+
+        self.assertEqual(claim_due_mailings(mailing.next_run), [mailing.id])
+        reschedule(mailing, now=mailing.next_run)
+        mailing.refresh_from_db()
+        self.assertEqual(mailing.status, Mailing.COMPLETED)
+        self.assertIsNone(mailing.next_run)
+
+    def test_mailing_finished_while_sending_stays_finished(self):
+        mailing = self.create_mailing(frequency=Mailing.DAILY)
+        claim_due_mailings(self.start)
+        attempt = Attempt.objects.create(mailing=mailing, status=Attempt.PENDING)
+
+        # Пользователь завершил рассылку, пока воркеры ее отправляли
+        mailing.refresh_from_db()
+        mailing.status = Mailing.COMPLETED
+        mailing.is_active = False
+        mailing.save()
+        finish_mailing([{"sent": 1, "failed": 0}], mailing.id, attempt.id)
+
+        mailing.refresh_from_db()
+        self.assertEqual(mailing.status, Mailing.COMPLETED)
+        self.assertEqual(mailing.next_run, self.start)
+        self.assertFalse(due_mailings(self.start + timedelta(days=2)).exists())
+
+    def test_timer_queue_follows_signals(self):
+        first = self.create_mailing()
+        queue = MailingTimerQueue()
+        queue.reload()
+        self.assertEqual(queue.next_deadline(), self.start)
+
+        second = self.create_mailing()
+        second.next_run = self.start - timedelta(hours=1)
+        second.save()
+        first.is_active = False
+        first.save()
+
+        # Изменения приходят из журнала в кеше, без полного перечитывания
+        with self.assertNumQueries(1):
+            self.assertEqual(queue.refresh(), 2)
+        self.assertEqual(queue.pop_due(self.start), [second.id])
+        self.assertIsNone(queue.next_deadline())
+
+    def test_mailing_is_claimed_once(self):
+        mailing = self.create_mailing()
+
+        self.assertEqual(claim_due_mailings(self.start), [mailing.id])
+        self.assertEqual(claim_due_mailings(self.start), [])
+        mailing.refresh_from_db()
+        self.assertEqual(mailing.status, Mailing.STARTED)
+
+    def test_skip_locked_claim_invalidates_cache(self):
+        mailing = self.create_mailing()
+        generation = get_generation(mailing.owner_id)
+
+        with mock.patch.object(
+            connection.features, "has_select_for_update_skip_locked", True
+        ):
+            self.assertEqual(claim_due_mailings(self.start), [mailing.id])
+
+        self.assertGreater(get_generation(mailing.owner_id), generation)
+
+    def test_send_mail_stops_when_broker_is_down(self):
+        mailings = [self.create_mailing() for _ in range(2)]
+        out, err = io.StringIO(), io.StringIO()
+
+        with (
+            mock.patch(
+                "messaging.tasks.send_mailing.delay", side_effect=ConnectionError
+            ) as delay,
+            self.assertLogs("messaging.scheduler", "ERROR"),
+        ):
+            call_command("send_mail", stdout=out, stderr=err)
+
+        self.assertEqual(delay.call_count, 2)
+        self.assertIn("Successfully started 0 mailings", out.getvalue())
+        for mailing in mailings:
+            mailing.refresh_from_db()
+            self.assertEqual(mailing.status, Mailing.CREATED)
+            self.assertGreater(mailing.next_run, timezone.now())
+
+
+def claim_until_empty(now, results):
+    claimed = []
+    while batch := claim_due_mailings(now, limit=5):
+        claimed.extend(batch)
+    results.put(claimed)
+
+
+@unittest.skipUnless(connection.vendor == "postgresql", "нужен PostgreSQL")
+class ConcurrentClaimTest(TransactionTestCase):
+    processes = 4
+
+    def test_parallel_schedulers_never_claim_twice(self):
+        owner = User.objects.create(email="owner@example.com")
+        message = Message.objects.create(subject="Тема", body="Текст", owner=owner)
+        now = timezone.now()
+        Mailing.objects.bulk_create(
+            Mailing(start_time=now, next_run=now, message=message, owner=owner)
+            for _ in range(200)
+        )
+
+        # Дочерние процессы должны открыть собственные соединения с БД
+        connections.close_all()
+        context = multiprocessing.get_context("fork")
+        results = context.Queue()
+        workers = [
+            context.Process(target=claim_until_empty, args=(now, results))
+            for _ in range(self.processes)
+        ]
+        for worker in workers:
+            worker.start()
+        claimed = [pk for _ in workers for pk in results.get(timeout=60)]
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(len(claimed), 200)
+        self.assertEqual(len(set(claimed)), 200)
+        self.assertFalse(Mailing.objects.filter(status=Mailing.CREATED).exists())
+
+
+class MessagingHomeViewTest(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create(email="owner@example.com")
+        other = User.objects.create(email="other@example.com")
+        message = Message.objects.create(subject="Тема", body="Текст", owner=self.owner)
+        clients = [
+            Client.objects.create(email=f"c{i}@example.com", owner=self.owner)
+            for i in range(3)
+        ]
+        for status, mailing_clients in (
+            (Mailing.STARTED, clients[:2]),
+            (Mailing.CREATED, clients[1:]),
+        ):
+            mailing = Mailing.objects.create(
+                start_time=timezone.now(),
+                message=message,
+                owner=self.owner,
+                status=status,
+            )
+            mailing.clients.set(mailing_clients)
+        Mailing.objects.create(start_time=timezone.now(), message=message, owner=other)
+
+    def get_stats(self):
+        response = self.client.get(reverse("messaging:home"))
+        return {
+            key: response.context[key]
+            for key in ("total_mailings", "active_mailings", "unique_clients")
+        }
+
+    def test_stats_are_cached_per_user(self):
+        self.client.force_login(self.owner)
+        expected = {"total_mailings": 2, "active_mailings": 1, "unique_clients": 3}
+        self.assertEqual(self.get_stats(), expected)
+
+        # Счетчики берутся из кеша, к рассылкам запросов нет
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.get_stats(), expected)
+        self.assertFalse(
+            [q for q in queries.captured_queries if "messaging_" in q["sql"]]
+        )
+
+    def test_signals_invalidate_stats(self):
+        self.client.force_login(self.owner)
+        self.get_stats()
+        Mailing.objects.filter(owner=self.owner).first().delete()
+        self.assertEqual(self.get_stats()["total_mailings"], 1)
+
+
+class AdminChangelistQueriesTest(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create(
+            email="admin@example.com", is_staff=True, is_superuser=True
+        )
+        self.client.force_login(self.admin)
+        self.message = Message.objects.create(subject="Тема", body="Текст")
+        self.clients = [
+            Client.objects.create(email=f"c{i}@example.com", full_name=f"К{i}")
+            for i in range(3)
+        ]
+
+    def add_mailings(self, count):
+        for _ in range(count):
+            mailing = Mailing.objects.create(
+                start_time=timezone.now(), message=self.message
+            )
+            mailing.clients.set(self.clients)
+            Attempt.objects.create(mailing=mailing, status=Attempt.SUCCESS)
+
+    def count_queries(self, url):
+        # Первый запрос прогревает кеш прав пользователя
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_depend_on_rows(self):
+        for name in ("mailing", "attempt"):
+            with self.subTest(name):
+                url = reverse(f"admin:messaging_{name}_changelist")
+                Mailing.objects.all().delete()
+                self.add_mailings(2)
+                expected = self.count_queries(url)
+
+                self.add_mailings(48)
+                with self.assertNumQueries(expected):
+                    self.client.get(url)
+
+
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create(email="owner@example.com")
+        message = Message.objects.create(subject="Тема", body="Текст", owner=self.owner)
+        mailing = Mailing.objects.create(
+            start_time=timezone.now(), message=message, owner=self.owner
+        )
+        Attempt.objects.bulk_create(
+            Attempt(mailing=mailing, status=Attempt.SUCCESS) for _ in range(25)
+        )
+        # Одинаковое время у части строк проверяет разбор ничьих по id
+        base = timezone.now()
+        for i, pk in enumerate(Attempt.objects.values_list("id", flat=True)):
+            Attempt.objects.filter(pk=pk).update(
+                attempt_time=base - timedelta(minutes=i // 4)
+            )
+        self.expected = list(
+            Attempt.objects.order_by("-attempt_time", "-id").values_list(
+                "id", flat=True
+            )
+        )
+
+    def test_pages_walk_forward_and_back_without_offset(self):
+        pages = []
+        cursor = None
+        with CaptureQueriesContext(connection) as queries:
+            while True:
+                page = paginate_keyset(
+                    Attempt.objects.all(), cursor, 10, "-attempt_time"
+                )
+                pages.append([attempt.pk for attempt in page])
+                if not page.has_next():
+                    break
+                cursor = page.next_cursor
+
+        self.assertEqual([pk for ids in pages for pk in ids], self.expected)
+        self.assertFalse(
+            [q for q in queries.captured_queries if "OFFSET" in q["sql"].upper()]
+        )
+
+        previous = paginate_keyset(
+            Attempt.objects.all(), page.previous_cursor, 10, "-attempt_time"
+        )
+        self.assertEqual([attempt.pk for attempt in previous], pages[-2])
+
+    @mock.patch.object(AttemptListView, "paginate_by", 10)
+    def test_attempt_list_view_is_paginated(self):
+        self.client.force_login(self.owner)
+        url = reverse("messaging:attempt_list")
+        response = self.client.get(url)
+        self.assertTrue(response.context["is_paginated"])
+        self.assertEqual(len(response.context["attempts"]), 10)
+
+        cursor = response.context["page_obj"].next_cursor
+        response = self.client.get(url, {"cursor": cursor})
+        self.assertEqual(
+            [attempt.pk for attempt in response.context["attempts"]],
+            self.expected[10:20],
+        )
+        self.assertEqual(self.client.get(url, {"cursor": "bad"}).status_code, 404)
+
+    def test_cursor_with_wrong_types_is_not_found(self):
+        for data in (
+            ["next", "2024-01-01T00:00:00+00:00", "x"],
+            ["next", "not a date", 1],
+            ["next", None, 1],
+            ["sideways", "2024-01-01T00:00:00+00:00", 1],
+            {"pk": "x"},
+        ):
+            cursor = base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+            with self.subTest(data=data), self.assertRaises(Http404):
+                paginate_keyset(Attempt.objects.all(), cursor, 10, "-attempt_time")
+
+
+class MailingDetailQueriesTest(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create(email="owner@example.com")
+        self.client.force_login(self.owner)
+        message = Message.objects.create(subject="Тема", body="Текст", owner=self.owner)
+        self.mailing = Mailing.objects.create(
+            start_time=timezone.now(), message=message, owner=self.owner
+        )
+
+    def add_clients(self, count):
+        clients = Client.objects.bulk_create(
+            Client(email=f"c{i}@example.com", full_name=f"К{i}", owner=self.owner)
+            for i in range(self.mailing.clients.count(), count)
+        )
+        self.mailing.clients.add(*clients)
+
+    def count_queries(self, url):
+        # Первый запрос прогревает кеш прав пользователя, смена поколения
+        # сбрасывает закешированный фрагмент со списком получателей
+        self.client.get(url)
+        bump_generation(self.owner.pk)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(queries)
+
+    @mock.patch.object(MailingDetailView, "recipients_per_page", 10)
+    def test_detail_shows_one_page_of_recipients(self):
+        url = reverse("messaging:mailing_detail", args=[self.mailing.pk])
+        self.add_clients(3)
+        expected = self.count_queries(url)
+
+        self.add_clients(35)
+        with self.assertNumQueries(expected):
+            response = self.client.get(url)
+        self.assertEqual(response.context["mailing"].clients_total, 35)
+        self.assertEqual(len(response.context["recipients"]), 10)
+
+        cursor = response.context["recipients"].next_cursor
+        response = self.client.get(url, {"cursor": cursor})
+        self.assertEqual(
+            response.context["recipients"].object_list[0].email, "c10@example.com"
+        )
+
+    def test_attempt_list_query_count_does_not_depend_on_rows(self):
+        url = reverse("messaging:attempt_list")
+        Attempt.objects.create(mailing=self.mailing, status=Attempt.SUCCESS)
+        expected = self.count_queries(url)
+
+        Attempt.objects.bulk_create(
+            Attempt(mailing=self.mailing, status=Attempt.SUCCESS) for _ in range(20)
+        )
+        with self.assertNumQueries(expected):
+            response = self.client.get(url)
+        self.assertContains(response, "Тема")
+
+
+class ClientImportTest(TestCase):
+    CSV = (
+        "email,full_name,comment\n"
+        "new1@example.com,Новый 1,\n"
+        "not-an-email,Ошибка,\n"
+        "old@example.com,Старый,\n"
+        "new2@example.com,Новый 2,VIP\n"
+        "new1@example.com,Повтор,\n"
+        "new3@example.com,,\n"
+    )
+
+    def setUp(self):
+        self.owner = User.objects.create(email="owner@example.com")
+        Client.objects.create(
+            email="old@example.com", full_name="Старый", owner=self.owner
+        )
+        # У другого владельца тот же адрес — это не дубликат
+        other = User.objects.create(email="other@example.com")
+        Client.objects.create(email="new2@example.com", full_name="Чужой", owner=other)
+
+    def test_import_skips_invalid_and_duplicates(self):
+        importer = ClientImporter(self.owner, batch_size=2)
+        reports = [
+            (r.rows, r.created)
+            for r in importer.progress(read_csv(io.BytesIO(self.CSV.encode())))
+        ]
+        self.assertEqual(reports, [(2, 1), (4, 2), (6, 2)])
+
+        report = importer.run(read_csv(io.BytesIO(self.CSV.encode())))
+        self.assertEqual(report.created, 0)
+        self.assertEqual(
+            sorted(
+                Client.objects.filter(owner=self.owner).values_list("email", flat=True)
+            ),
+            ["new1@example.com", "new2@example.com", "old@example.com"],
+        )
+        self.assertEqual(
+            Client.objects.get(owner=self.owner, email="new2@example.com").comment,
+            "VIP",
+        )
+
+    def test_rows_dropped_by_unique_index_are_not_counted(self):
+        inserted = False
+
+        def concurrent_import(execute, sql, params, many, context):
+            # Другой импорт добавил адрес между проверкой дубликатов и
+            # вставкой
+            nonlocal inserted
+            if sql.startswith("INSERT") and "messaging_client" in sql and not inserted:
+                inserted = True
+                Client.objects.create(
+                    email="new1@example.com", full_name="Параллельный", owner=self.owner
+                )
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(concurrent_import):
+            report = ClientImporter(self.owner).run(
+                read_csv(io.BytesIO(self.CSV.encode()))
+            )
+
+        self.assertTrue(inserted)
+        self.assertEqual((report.created, report.duplicates), (1, 3))
+        self.assertEqual(
+            Client.objects.get(email="new1@example.com").full_name, "Параллельный"
+        )
+
+    def test_queries_per_batch_do_not_depend_on_rows(self):
+        def count_queries(size):
+            rows = (
+                {"email": f"c{size}-{i}@example.com", "full_name": f"К{i}"}
+                for i in range(size)
+            )
+            with CaptureQueriesContext(connection) as queries:
+                ClientImporter(self.owner, batch_size=size).run(rows)
+            return len(queries)
+
+        self.assertEqual(count_queries(10), count_queries(200))
+
+    def test_view_streams_progress(self):
+        self.client.force_login(self.owner)
+        upload = SimpleUploadedFile("clients.csv", self.CSV.encode())
+        response = self.client.post(
+            reverse("messaging:client_import"), {"file": upload}
+        )
+        self.assertTrue(response.streaming)
+        output = b"".join(response.streaming_content).decode()
+        self.assertIn("добавлено: 2", output)
+        self.assertIn("Строка 3: Некорректный email", output)
+        self.assertTrue(output.endswith("Импорт завершен\n"))
+
+    def test_command(self):
+        with tempfile.NamedTemporaryFile(suffix=".csv") as file:
+            file.write(self.CSV.encode())
+            file.flush()
+            out = io.StringIO()
+            call_command(
+                "import_clients",
+                file.name,
+                owner=self.owner.email,
+                stdout=out,
+                stderr=io.StringIO(),
+            )
+        self.assertIn("добавлено: 2", out.getvalue())
+
+    @unittest.skipUnless(openpyxl, "openpyxl не установлен")
+    def test_read_xlsx(self):
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.append(["Email", "full_name"])
+        sheet.append(["x@example.com", "Икс"])
+        data = io.BytesIO()
+        workbook.save(data)
+        data.seek(0)
+        self.assertEqual(
+            list(read_xlsx(data)),
+            [{"email": "x@example.com", "full_name": "Икс", "comment": None}],
+        )
+
+
+class ExportTest(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create(email="owner@example.com")
+        other = User.objects.create(email="other@example.com")
+        message = Message.objects.create(subject="Тема", body="Текст", owner=self.owner)
+        self.mailing = Mailing.objects.create(
+            start_time=timezone.now(), message=message, owner=self.owner
+        )
+        Attempt.objects.create(mailing=self.mailing, status=Attempt.SUCCESS)
+        Client.objects.create(
+            email="mine@example.com", full_name="Мой", owner=self.owner
+        )
+        Client.objects.create(email="alien@example.com", full_name="Чужой", owner=other)
+        self.client.force_login(self.owner)
+
+    def export(self, kind):
+        response = self.client.get(reverse("messaging:export", args=[kind]))
+        self.assertTrue(response.streaming)
+        self.assertIn("attachment", response["Content-Disposition"])
+        return b"".join(response.streaming_content).decode("utf-8-sig").splitlines()
+
+    def test_exports_only_own_rows(self):
+        clients = self.export("clients")
+        self.assertEqual(clients[0], "ID,Email,ФИО,Комментарий")
+        self.assertEqual(len(clients), 2)
+        self.assertIn("mine@example.com", clients[1])
+
+        attempts = self.export("attempts")
+        self.assertEqual(len(attempts), 2)
+        self.assertIn(f"{self.mailing.pk},Тема,success", attempts[1])
+        self.assertEqual(len(self.export("mailings")), 2)
+
+    def test_unknown_export(self):
+        response = self.client.get(reverse("messaging:export", args=["users"]))
+        self.assertEqual(response.status_code, 404)
+
+
+class ClientDeduplicationTest(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create(email="owner@example.com")
+
+    def test_email_is_normalized_and_unique_per_owner(self):
+        client = Client.objects.create(
+            email=" Mixed@Example.COM ", full_name="К", owner=self.owner
+        )
+        self.assertEqual(client.email, "mixed@example.com")
+        other = User.objects.create(email="other@example.com")
+        Client.objects.create(email="mixed@example.com", full_name="К", owner=other)
+
+        self.client.force_login(self.owner)
+        response = self.client.post(
+            reverse("messaging:client_create"),
+            {"email": "MIXED@example.com", "full_name": "Повтор"},
+        )
+        self.assertContains(response, "Клиент с таким email уже есть")
+        self.assertEqual(Client.objects.filter(owner=self.owner).count(), 1)
+
+        response = self.client.post(
+            reverse("messaging:client_update", args=[client.pk]),
+            {"email": "mixed@example.com", "full_name": "Новое имя"},
+        )
+        self.assertEqual(response.status_code, 302)
+
+    def assert_duplicates_merged(self, merge):
+        message = Message.objects.create(subject="Тема", body="Текст", owner=self.owner)
+        mailings = [
+            Mailing.objects.create(
+                start_time=timezone.now(), message=message, owner=self.owner
+            )
+            for _ in range(2)
+        ]
+        # Дубликаты, созданные до появления ограничения
+        keeper, *duplicates = Client.objects.bulk_create(
+            Client(email=email, full_name="К", owner=self.owner)
+            for email in ("a@example.com", "A@example.com", " a@EXAMPLE.com")
+        )
+        single = Client.objects.create(email="b@example.com", full_name="Б")
+        mailings[0].clients.add(keeper, duplicates[0])
+        mailings[1].clients.add(duplicates[1], single)
+        attempt = Attempt.objects.create(mailing=mailings[1], status=Attempt.SUCCESS)
+        delivery = Delivery.objects.create(
+            attempt=attempt,
+            mailing=mailings[1],
+            client=duplicates[1],
+            email="a@example.com",
+            status=Delivery.SUCCESS,
+        )
+
+        merge()
+
+        self.assertEqual(
+            list(Client.objects.filter(owner=self.owner).values_list("id", "email")),
+            [(keeper.pk, "a@example.com")],
+        )
+        self.assertEqual(list(mailings[0].clients.all()), [keeper])
+        self.assertEqual(set(mailings[1].clients.all()), {keeper, single})
+        delivery.refresh_from_db()
+        self.assertEqual(delivery.client, keeper)
+
+    def test_merge_duplicates_rewires_mailings(self):
+        out = io.StringIO()
+        self.assert_duplicates_merged(
+            lambda: call_command("merge_duplicate_clients", batch_size=1, stdout=out)
+        )
+        self.assertIn("Удалено дубликатов: 2", out.getvalue())
+
+    def test_migration_merges_duplicates(self):
+        migration = importlib.import_module(
+            "messaging.migrations.0012_merge_duplicate_clients"
+        )
+        self.assert_duplicates_merged(
+            lambda: migration.merge_duplicates(global_apps, None)
+        )
+
+
+@override_settings(
+    CACHES={"default": {"BACKEND": "config.metrics.InstrumentedLocMemCache"}}
+)
+class MetricsMiddlewareTest(TestCase):
+    def setUp(self):
+        registry.reset()
+        cache.clear()
+        self.user = User.objects.create(email="owner@example.com")
+        self.client.force_login(self.user)
+
+    def test_records_queries_and_cache(self):
+        url = reverse("messaging:home")
+        self.client.get(url)
+        self.client.get(url)
+
+        labels = ("messaging:home", "GET", "200")
+        self.assertEqual(registry.requests[labels], 2)
+        self.assertGreater(registry.queries["messaging:home"], 0)
+        # Второй запрос берет счетчики главной страницы из кеша
+        self.assertGreater(registry.cache_hits["messaging:home"], 0)
+        self.assertGreater(registry.cache_misses["messaging:home"], 0)
+
+        response = self.client.get(reverse("metrics"))
+        self.assertContains(
+            response,
+            'http_requests_total{view="messaging:home",method="GET",status="200"} 2',
+        )
+        self.assertContains(
+            response, 'http_request_duration_seconds_count{view="messaging:home"} 2'
+        )
+        self.assertEqual(
+            self.client.get(reverse("metrics"), REMOTE_ADDR="10.0.0.1").status_code,
+            404,
+        )
+
+    @override_settings(SLOW_REQUEST_THRESHOLD=0)
+    def test_slow_request_is_logged_with_top_query(self):
+        with self.assertLogs("config.metrics", "WARNING") as logs:
+            self.client.get(reverse("messaging:client_list"))
+        self.assertIn("Медленный запрос GET /clients/", logs.output[0])
+        self.assertIn("SELECT", logs.output[0])
+
+    @override_settings(METRICS_DEBUG_PANEL=True)
+    def test_debug_panel(self):
+        response = self.client.get(reverse("messaging:home"))
+        self.assertIn("total;dur=", response["Server-Timing"])
+        self.assertContains(response, "· SQL ")
+
+
+class ResponseCacheTest(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create(email="owner@example.com")
+        self.client.force_login(self.owner)
+        self.client.cookies[settings.CSRF_COOKIE_NAME] = "a" * 32
+        Client.objects.create(
+            email="first@example.com", full_name="Первый", owner=self.owner
+        )
+        self.url = reverse("messaging:client_list")
+
+    def tearDown(self):
+        cache.clear()
+
+    def messaging_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        return response, [
+            q["sql"] for q in queries.captured_queries if "messaging_" in q["sql"]
+        ]
+
+    def test_repeat_view_skips_db_until_data_changes(self):
+        self.messaging_queries()
+        response, queries = self.messaging_queries()
+        self.assertEqual(queries, [])
+        self.assertContains(response, "first@example.com")
+
+        Client.objects.create(
+            email="second@example.com", full_name="Второй", owner=self.owner
+        )
+        response, queries = self.messaging_queries()
+        self.assertTrue(queries)
+        self.assertContains(response, "second@example.com")
+
+    def test_other_owner_changes_keep_cache(self):
+        self.messaging_queries()
+        other = User.objects.create(email="other@example.com")
+        Client.objects.create(email="alien@example.com", full_name="Чужой", owner=other)
+        self.assertEqual(self.messaging_queries()[1], [])
+
+    def test_pages_with_flash_messages_are_not_cached(self):
+        self.messaging_queries()
+        # Отправка рассылки без клиентов оставляет flash-сообщение об ошибке
+        message = Message.objects.create(subject="Тема", body="Текст", owner=self.owner)
+        mailing = Mailing.objects.create(
+            start_time=timezone.now(), message=message, owner=self.owner
+        )
+        self.messaging_queries()
+        self.client.post(reverse("messaging:mailing_send", args=[mailing.pk]))
+
+        response, queries = self.messaging_queries()
+        self.assertTrue(queries)
+
+
+class TieredCacheTest(SimpleTestCase):
+    def setUp(self):
+        # Состояние Redis общее для экземпляров с одним LOCATION
+        patcher = mock.patch.dict("config.cache._states", clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_cache(self, location=None, **options):
+        options = {
+            "LOCAL_BYPASS": ["generation:"],
+            "BREAKER_THRESHOLD": 2,
+            **options,
+        }
+        tiered = TieredCache(
+            location or f"redis://127.0.0.1:{free_port()}/0", {"OPTIONS": options}
+        )
+        tiered.local.clear()
+        return tiered
+
+    def test_redis_outage_degrades_to_local_tier(self):
+        tiered = self.make_cache()
+        with self.assertLogs("config.cache", "WARNING"):
+            tiered.set("key", "value")
+            self.assertEqual(tiered.get("key"), "value")
+            self.assertIsNone(tiered.get("missing"))
+
+        # После порога ошибок Redis больше не опрашивается
+        self.assertTrue(tiered.breaker.is_open)
+        with mock.patch.object(tiered.remote, "get") as remote_get:
+            self.assertTrue(tiered.add("counter", 1))
+            self.assertEqual(tiered.incr("counter"), 2)
+            self.assertEqual(tiered.get("counter"), 2)
+        remote_get.assert_not_called()
+
+    @unittest.skipUnless(fakeredis, "fakeredis не установлен")
+    def test_local_tier_in_front_of_redis(self):
+        server = fakeredis.FakeServer()
+        tiered = self.make_cache(
+            "redis://localhost:6379/0",
+            connection_class=fakeredis.FakeConnection,
+            server=server,
+        )
+        # Запись другого процесса попадает только в Redis
+        tiered.remote.set("page", "old")
+        self.assertEqual(tiered.get("page"), "old")
+        tiered.remote.set("page", "new")
+        # До истечения короткого TTL значение берется из памяти процесса
+        self.assertEqual(tiered.get("page"), "old")
+        tiered.local.clear()
+        self.assertEqual(tiered.get("page"), "new")
+
+        # Счетчики из LOCAL_BYPASS читаются из Redis сразу
+        tiered.set("generation:1", 1)
+        tiered.remote.incr("generation:1")
+        self.assertEqual(tiered.get("generation:1"), 2)
+
+        server.connected = False
+        with self.assertLogs("config.cache", "WARNING"):
+            self.assertEqual(tiered.get("page"), "new")
+            tiered.set("page", "offline")
+        self.assertEqual(tiered.get("page"), "offline")
+
+    @unittest.skipUnless(fakeredis, "fakeredis не установлен")
+    def test_counters_bumped_offline_are_replayed(self):
+        server = fakeredis.FakeServer()
+        tiered = self.make_cache(
+            "redis://localhost:6379/0",
+            BREAKER_RESET_TIMEOUT=60,
+            connection_class=fakeredis.FakeConnection,
+            server=server,
+        )
+        tiered.set("generation:1", 5)
+        self.assertEqual(tiered.get("generation:1"), 5)
+        tiered.set("page", "cached under 5")
+
+        server.connected = False
+        with self.assertLogs("config.cache", "WARNING"):
+            self.assertEqual(tiered.incr("generation:1"), 6)
+            self.assertEqual(tiered.incr("generation:1"), 7)
+            tiered.delete("generation:2")
+        self.assertTrue(tiered.breaker.is_open)
+        # Страницы не из LOCAL_BYPASS не запоминаются
+        tiered.set("page", "offline")
+        self.assertEqual(
+            list(tiered.state.pending), [("generation:1", None), ("generation:2", None)]
+        )
+
+        server.connected = True
+        tiered.remote.set("generation:2", 3)
+        tiered.breaker.opened_at -= 60
+        # Изменения повторяются в Redis до первого обращения к нему
+        self.assertEqual(tiered.incr("generation:1"), 8)
+        self.assertEqual(tiered.get("generation:1"), 8)
+        self.assertIsNone(tiered.remote.get("generation:2"))
+        self.assertEqual(tiered.state.pending, {})
+        self.assertFalse(tiered.breaker.is_open)
+
+    @unittest.skipUnless(fakeredis, "fakeredis не установлен")
+    def test_outage_state_is_shared_between_threads(self):
+        server = fakeredis.FakeServer()
+        location = "redis://localhost:6379/0"
+        options = {
+            "BREAKER_RESET_TIMEOUT": 60,
+            "connection_class": fakeredis.FakeConnection,
+            "server": server,
+        }
+        tiered = self.make_cache(location, **options)
+        tiered.remote.set("generation:1", 5)
+
+        def bump_generation():
+            # Django создает экземпляр бэкенда на каждый поток
+            writer = self.make_cache(location, **options)
+            writer.add("generation:1", 1)
+            writer.incr("generation:1")
+
+        server.connected = False
+        with self.assertLogs("config.cache", "WARNING"):
+            thread = threading.Thread(target=bump_generation)
+            thread.start()
+            thread.join()
+
+        # Размыкатель открыт и для других потоков: Redis больше не ждут
+        self.assertTrue(tiered.breaker.is_open)
+        server.connected = True
+        tiered.breaker.opened_at -= 60
+        self.assertIsNone(tiered.get("page"))
+        self.assertEqual(tiered.get("generation:1"), 6)
@@ -3,14 +3,17 @@ from .views import (
     AttemptListView,
     ClientCreateView,
     ClientDeleteView,  # Добавлено
+    ClientImportView,
     ClientListView,
     ClientUpdateView,  # Добавлено
     DisableMailingView,
+    ExportView,
     FinishMailingView,
     MailingCreateView,
     MailingDeleteView,
     MailingDetailView,
     MailingListView,
+    MailingProgressView,
     MailingSendView,
     MailingUpdateView,  # Добавлено
     MessageCreateView,
@@ -19,6 +22,7 @@ from .views import (
     MessageListView,
     MessageUpdateView,
     MessagingHomeView,
+    StatsView,
     ToggleUserStatusView,
     UserListView,
     UserMailingsView,
@@ -39,6 +43,11 @@ urlpatterns = [
         "mailings/<int:pk>/delete/", MailingDeleteView.as_view(), name="mailing_delete"
     ),
     path("mailings/<int:pk>/send/", MailingSendView.as_view(), name="mailing_send"),
+    path(
+        "mailings/<int:pk>/progress/",
+        MailingProgressView.as_view(),
+        name="mailing_progress",
+    ),
     path(
         "mailings/<int:pk>/disable/",
         DisableMailingView.as_view(),
@@ -51,6 +60,7 @@ urlpatterns = [
     # Client URLs
     path("clients/", ClientListView.as_view(), name="client_list"),
     path("clients/create/", ClientCreateView.as_view(), name="client_create"),
+    path("clients/import/", ClientImportView.as_view(), name="client_import"),
     path("clients/<int:pk>/update/", ClientUpdateView.as_view(), name="client_update"),
     path("clients/<int:pk>/delete/", ClientDeleteView.as_view(), name="client_delete"),
     # Message URLs
@@ -65,9 +75,11 @@ urlpatterns = [
     ),
     # Attempt URLs
     path("attempts/", AttemptListView.as_view(), name="attempt_list"),
+    path("stats/", StatsView.as_view(), name="stats"),
+    path("export/<str:kind>.csv", ExportView.as_view(), name="export"),
     # User URLs
     path("users/", UserListView.as_view(), name="user_list"),
     path("users/<int:pk>/toggle/", ToggleUserStatusView.as_view(), name="toggle_user"),
     # Home URL
     path("", MessagingHomeView.as_view(), name="home"),
-]
\ No newline at end of file
+]
@@ -6,6 +6,8 @@ from django.contrib.auth.mixins import (
 )
 from django.shortcuts import redirect, render, get_object_or_404
 from django.urls import reverse_lazy
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
 from django.views import View
 from django.views.generic import (
     ListView,
@@ -16,10 +18,27 @@ from django.views.generic import (
     RedirectView,
     TemplateView,
 )
-from messaging.forms import ClientForm, MessageForm, MailingForm
-from messaging.mixins import OwnerRequiredMixin
+from messaging.caching import CachedResponseMixin
+from messaging.forms import ClientForm, ClientImportForm, MessageForm, MailingForm
+from messaging.mixins import (
+    KeysetPaginationMixin,
+    OwnerRequiredMixin,
+    paginate_keyset,
+)
 from messaging.models import Client, Message, Mailing, Attempt
 from django.contrib import messages
+from django.db.models import Count
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from messaging.exports import EXPORTS, stream_csv
+from messaging.imports import (
+    ClientImporter,
+    ImportFileError,
+    ImportReport,
+    read_rows,
+)
+from messaging.progress import get_progress
+from messaging.scheduler import claim_mailing, dispatch_mailings
+from messaging.stats import get_dashboard_stats, get_user_stats, record_attempt
 from users.models import User
 
 
@@ -27,8 +46,15 @@ class MessagingHomeView(TemplateView):
     template_name = "messaging/home.html"
     context_object_name = "home"
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update(get_dashboard_stats(self.request.user))
+        return context
+
 
-class ClientListView(LoginRequiredMixin, ListView):
+class ClientListView(
+    LoginRequiredMixin, CachedResponseMixin, KeysetPaginationMixin, ListView
+):
     model = Client
     template_name = "messaging/client_list.html"
     context_object_name = "clients"
@@ -45,11 +71,47 @@ class ClientCreateView(LoginRequiredMixin, CreateView):
     template_name = "messaging/client_form.html"
     success_url = reverse_lazy("messaging:client_list")
 
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        kwargs["owner"] = self.request.user
+        return kwargs
+
     def form_valid(self, form):
         form.instance.owner = self.request.user
         return super().form_valid(form)
 
 
+class ClientImportView(LoginRequiredMixin, View):
+    """Импорт клиентов из CSV/XLSX с выводом прогресса по мере обработки"""
+
+    template_name = "messaging/client_import.html"
+
+    def get(self, request):
+        return render(request, self.template_name, {"form": ClientImportForm()})
+
+    def post(self, request):
+        form = ClientImportForm(request.POST, request.FILES)
+        if not form.is_valid():
+            return render(request, self.template_name, {"form": form})
+
+        upload = form.cleaned_data["file"]
+        importer = ClientImporter(request.user)
+
+        def stream():
+            report = ImportReport()
+            try:
+                for report in importer.progress(read_rows(upload, upload.name)):
+                    yield f"{report}\n"
+            except ImportFileError as e:
+                yield f"Ошибка: {e}\n"
+                return
+            for line, error in report.errors:
+                yield f"Строка {line}: {error}\n"
+            yield "Импорт завершен\n"
+
+        return StreamingHttpResponse(stream(), content_type="text/plain; charset=utf-8")
+
+
 class ClientUpdateView(LoginRequiredMixin, UpdateView):
     model = Client
     form_class = ClientForm
@@ -69,7 +131,23 @@ class ClientDeleteView(LoginRequiredMixin, DeleteView):
         return Client.objects.filter(owner=self.request.user)
 
 
-class MessageListView(LoginRequiredMixin, ListView):
+class ExportView(LoginRequiredMixin, View):
+    """Выгрузка клиентов, рассылок или попыток в CSV потоком"""
+
+    def get(self, request, kind):
+        if kind not in EXPORTS:
+            raise Http404("Неизвестная выгрузка")
+        filename = f"{kind}-{timezone.localdate():%Y-%m-%d}.csv"
+        return StreamingHttpResponse(
+            stream_csv(kind, request.user),
+            content_type="text/csv; charset=utf-8",
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        )
+
+
+class MessageListView(
+    LoginRequiredMixin, CachedResponseMixin, KeysetPaginationMixin, ListView
+):
     model = Message
     template_name = "messaging/message_list.html"
 
@@ -115,10 +193,13 @@ class MessageDetailView(LoginRequiredMixin, DetailView):
         return Message.objects.filter(owner=self.request.user)
 
 
-class MailingListView(LoginRequiredMixin, ListView):
+class MailingListView(
+    LoginRequiredMixin, CachedResponseMixin, KeysetPaginationMixin, ListView
+):
     model = Mailing
     template_name = "messaging/mailing_list.html"
     context_object_name = "mailings"
+    keyset_field = "-id"
 
     def get_queryset(self):
         if self.request.user.has_perm("users.can_view_all"):
@@ -201,34 +282,67 @@ class MailingDeleteView(LoginRequiredMixin, DeleteView):
         return Mailing.objects.filter(owner=self.request.user)
 
 
-class MailingDetailView(LoginRequiredMixin, DetailView):
+class MailingDetailView(LoginRequiredMixin, CachedResponseMixin, DetailView):
     model = Mailing
     template_name = "messaging/mailing_detail.html"
     context_object_name = "mailing"
+    recipients_per_page = 50
 
     def get_queryset(self):
-        return Mailing.objects.filter(owner=self.request.user)
+        return (
+            Mailing.objects.filter(owner=self.request.user)
+            .select_related("message")
+            .annotate(clients_total=Count("clients"))
+        )
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # Получатели выводятся постранично: у рассылки их могут быть
+        # сотни тысяч. Страница читается лениво — при попадании во фрагмент
+        # кеша шаблона запроса к БД не будет
+        context["recipients"] = SimpleLazyObject(
+            lambda: paginate_keyset(
+                self.object.clients.only("id", "full_name", "email"),
+                self.request.GET.get("cursor"),
+                self.recipients_per_page,
+            )
+        )
+        return context
 
 
 class MailingSendView(LoginRequiredMixin, View):
+    """Ставит рассылку в очередь Celery, не дожидаясь отправки"""
+
     def post(self, request, pk):
         mailing = get_object_or_404(Mailing, pk=pk, owner=request.user)
         try:
-            sent_count = mailing.send()
-            Attempt.objects.create(
-                mailing=mailing, status="SUCCESS", server_response="Успешно"
-            )
-            messages.success(
-                request, f"Рассылка успешно отправлена {sent_count} клиентам!"
-            )
+            mailing.check_can_send()
+            if not mailing.clients.exists():
+                raise ValueError("Нет клиентов для отправки")
+            if not claim_mailing(mailing.pk):
+                raise ValueError("Рассылка уже запущена")
+            if not dispatch_mailings([mailing.pk]):
+                raise ValueError("Очередь отправки недоступна")
+            messages.success(request, f"Рассылка {mailing.id} поставлена в очередь")
         except Exception as e:
-            Attempt.objects.create(
-                mailing=mailing, status="FAILURE", server_response={str(e)}
+            attempt = Attempt.objects.create(
+                mailing=mailing, status=Attempt.FAILURE, server_response=str(e)
             )
+            record_attempt(attempt)
             messages.error(request, f"Ошибка при отправке рассылки: {str(e)}")
         return redirect("messaging:mailing_list")
 
 
+class MailingProgressView(LoginRequiredMixin, View):
+    """Прогресс отправки рассылки в JSON, читается только из кеша"""
+
+    def get(self, request, pk):
+        progress = get_progress(pk)
+        if progress is None or progress.pop("owner") != request.user.pk:
+            return JsonResponse({"error": "Отправка не найдена"}, status=404)
+        return JsonResponse(progress)
+
+
 class UserMailingsView(PermissionRequiredMixin, ListView):
     permission_required = "messaging.can_view_all_mailings"
     template_name = "messaging/user_mailings.html"
@@ -247,7 +361,9 @@ class UserMailingsView(PermissionRequiredMixin, ListView):
         return context
 
 
-class UserListView(LoginRequiredMixin, UserPassesTestMixin, ListView):
+class UserListView(
+    LoginRequiredMixin, UserPassesTestMixin, KeysetPaginationMixin, ListView
+):
     permission_required = "users.view_user"
     model = User
     template_name = "messaging/user_list.html"
@@ -277,13 +393,27 @@ class ToggleUserStatusView(LoginRequiredMixin, UserPassesTestMixin, View):
         return redirect("messaging:user_list")
 
 
-class AttemptListView(LoginRequiredMixin, ListView):
+class StatsView(LoginRequiredMixin, TemplateView):
+    """Статистика попыток и писем пользователя по дням"""
+
+    template_name = "messaging/stats.html"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update(get_user_stats(self.request.user))
+        return context
+
+
+class AttemptListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     model = Attempt
     template_name = "attempts/attempt_list.html"
     context_object_name = "attempts"
+    keyset_field = "-attempt_time"
 
     def get_queryset(self):
-        return Attempt.objects.filter(mailing__owner=self.request.user)
+        return Attempt.objects.filter(mailing__owner=self.request.user).select_related(
+            "mailing__message"
+        )
 
 
 @login_required
@@ -301,4 +431,4 @@ class DisableMailingView(View):
         mailing = get_object_or_404(Mailing, pk=pk)
         mailing.is_active = False
         mailing.save()
-        return redirect("messaging:mailing_list")
\ No newline at end of file
+        return redirect("messaging:mailing_list")
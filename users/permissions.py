@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+PERMISSIONS_VERSION_KEY = "permissions:version"
+
+
+def permissions_version():
+    """Текущая версия прав: меняется при любом изменении групп и прав"""
+    version = cache.get(PERMISSIONS_VERSION_KEY)
+    if version is None:
+        cache.add(PERMISSIONS_VERSION_KEY, 1, None)
+        version = cache.get(PERMISSIONS_VERSION_KEY, 1)
+    return version
+
+
+def invalidate_permissions():
+    """Делает устаревшими права всех пользователей, закешированные ранее"""
+    cache.add(PERMISSIONS_VERSION_KEY, 1, None)
+    try:
+        cache.incr(PERMISSIONS_VERSION_KEY)
+    except ValueError:
+        # Ключ вытеснен из кеша — новая версия появится при следующем чтении
+        pass
+
+
+class CachedPermissionBackend(ModelBackend):
+    """ModelBackend, который хранит набор прав пользователя в кеше.
+
+    В пределах запроса права читаются один раз (кеш на объекте
+    пользователя, как в ModelBackend), между запросами — из кеша по ключу
+    с версией прав, поэтому прогретый запрос не обращается к таблицам
+    групп и прав. Версия увеличивается сигналами из users/signals.py.
+    """
+
+    def get_all_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        if not hasattr(user_obj, "_perm_cache"):
+            key = "permissions:{}:{}:{}".format(
+                permissions_version(), user_obj.pk, int(user_obj.is_superuser)
+            )
+            perms = cache.get(key)
+            if perms is None:
+                perms = super().get_all_permissions(user_obj)
+                cache.set(key, perms, settings.PERMISSIONS_CACHE_TIMEOUT)
+            user_obj._perm_cache = perms
+        return user_obj._perm_cache
@@ -1,3 +1,73 @@
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 
-# Create your tests here.
\ No newline at end of file
+from users.models import User
+
+
+class CachedPermissionBackendTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="manager@example.com")
+        self.group = Group.objects.create(name="Менеджеры")
+        self.group.permissions.add(
+            Permission.objects.get(
+                codename="can_view_all", content_type__app_label="users"
+            )
+        )
+        self.user.groups.add(self.group)
+
+    def tearDown(self):
+        # Первичные ключи пользователей повторяются между тестами
+        cache.clear()
+
+    def fresh_user(self):
+        # Новый объект — как request.user в следующем запросе
+        return User.objects.get(pk=self.user.pk)
+
+    def auth_queries(self, func):
+        with CaptureQueriesContext(connection) as queries:
+            func()
+        return [q["sql"] for q in queries.captured_queries if "auth_" in q["sql"]]
+
+    def test_warm_request_does_not_query_permissions(self):
+        self.assertTrue(self.fresh_user().has_perm("users.can_view_all"))
+
+        user = self.fresh_user()
+        self.assertEqual(
+            self.auth_queries(
+                lambda: [
+                    user.has_perm("users.can_view_all"),
+                    user.has_perm("users.can_finish_mailing"),
+                    user.has_module_perms("users"),
+                ]
+            ),
+            [],
+        )
+
+        self.client.force_login(self.user)
+        self.client.get(reverse("messaging:client_list"))
+        self.assertEqual(
+            self.auth_queries(
+                lambda: self.client.get(reverse("messaging:client_list"))
+            ),
+            [],
+        )
+
+    def test_group_changes_invalidate_cache(self):
+        self.assertFalse(self.fresh_user().has_perm("users.can_finish_mailing"))
+        self.group.permissions.add(
+            Permission.objects.get(
+                codename="can_finish_mailing", content_type__app_label="users"
+            )
+        )
+        self.assertTrue(self.fresh_user().has_perm("users.can_finish_mailing"))
+
+        self.user.groups.remove(self.group)
+        self.assertFalse(self.fresh_user().has_perm("users.can_view_all"))
+
+        self.user.is_superuser = True
+        self.user.save()
+        self.assertTrue(self.fresh_user().has_perm("users.can_view_all"))